@@ -1,80 +1,349 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 from model.chatbot_model import MentalHealthChatbot
+from model.batching import BatchScheduler, SchedulerBusy
+from model.retrieval import RetrievalResponder
 from utils.session_logger import SessionLogger
 from utils.content_filter import ContentFilter
+from utils.session_store import SessionStore, SQLiteSessionStore
+from utils.profiling import stage_timer
+from utils import metrics
 import json
-import uuid
 from datetime import datetime
 import os
+import time
+import torch
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
 
 # Initialize components
-chatbot = MentalHealthChatbot()
-session_logger = SessionLogger()
+# The model loads in the background so the server binds immediately; until it is ready
+# requests get a supportive default response and /readyz reports 503
+model_lazy = os.environ.get('MODEL_LAZY', '1') == '1'
+chatbot = MentalHealthChatbot(
+    model_name=os.environ.get('MODEL_NAME', 'microsoft/DialoGPT-medium'),
+    kv_cache_mb=int(os.environ.get('KV_CACHE_MB', 0)),
+    max_context_tokens=int(os.environ.get('MAX_CONTEXT_TOKENS', 768)),
+    max_context_turns=int(os.environ.get('MAX_CONTEXT_TURNS', 3)),
+    max_new_tokens=int(os.environ.get('MAX_NEW_TOKENS', 100)),
+    lazy=model_lazy,
+    response_cache_size=int(os.environ.get('RESPONSE_CACHE_SIZE', 1000)),
+    response_cache_ttl=float(os.environ.get('RESPONSE_CACHE_TTL', 3600)),
+    response_cache_pool=int(os.environ.get('RESPONSE_CACHE_POOL', 4))
+)
+if model_lazy:
+    chatbot.load_async(warmup=os.environ.get('MODEL_WARMUP', '1') == '1')
+batch_scheduler = BatchScheduler(
+    chatbot,
+    max_batch_size=int(os.environ.get('BATCH_MAX_SIZE', 8)),
+    max_wait_ms=float(os.environ.get('BATCH_MAX_WAIT_MS', 20)),
+    # Requests beyond this many waiting for the model get an immediate 503 with Retry-After
+    max_queue=int(os.environ.get('BATCH_MAX_QUEUE', 64))
+)
+# Latency budget in seconds for a chat reply, counted from its arrival; clients can lower it with an
+# X-Request-Timeout header. Past it, generation stops and the reply falls back to whole sentences or a
+# supportive default (0 disables)
+request_timeout = float(os.environ.get('REQUEST_TIMEOUT', 25))
+session_logger = SessionLogger(
+    log_file=os.environ.get('LOG_FILE', 'logs/user_sessions.log'),
+    buffered=os.environ.get('LOG_BUFFERED', '1') == '1',
+    flush_interval=float(os.environ.get('LOG_FLUSH_INTERVAL', 1.0)),
+    flush_size=int(os.environ.get('LOG_FLUSH_SIZE', 100)),
+    fsync=os.environ.get('LOG_FSYNC', '0') == '1',
+    max_bytes=int(os.environ.get('LOG_MAX_BYTES', 0)),
+    rotate_interval=int(os.environ.get('LOG_ROTATE_INTERVAL', 0))
+)
 content_filter = ContentFilter()
+# Messages close enough to a curated user turn are answered with its curated reply, skipping the model.
+# Off by default: the curated turns come from whole conversations, so a reply written for a later turn
+# can match a user's first message
+retrieval = None
+if os.environ.get('RETRIEVAL_ENABLED', '0') == '1':
+    try:
+        retrieval = RetrievalResponder(
+            os.environ.get('RETRIEVAL_DATA', 'data/mental_health_conversations.json'),
+            threshold=float(os.environ.get('RETRIEVAL_THRESHOLD', 0.6))
+        )
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Retrieval responder disabled: {e}")
+# Prometheus metrics at /metrics; stage histograms are fed by the pipeline's stage timers,
+# which PROFILE_STAGES=1 also enables on their own (reported under `stages` in /api/sessions)
+metrics_enabled = os.environ.get('METRICS_ENABLED', '1') == '1'
+stage_timer.enabled = metrics_enabled or os.environ.get('PROFILE_STAGES', '0') == '1'
+if metrics_enabled:
+    stage_timer.observers.append(metrics.observe_stage)
+
+# Store active sessions: bounded history, idle expiry and an LRU cap on the number of sessions.
+# SESSION_STORE=sqlite shares them between worker processes (see gunicorn.conf.py)
+session_store_options = {
+    'max_sessions': int(os.environ.get('SESSION_MAX', 10000)),
+    'idle_ttl': int(os.environ.get('SESSION_IDLE_TTL', 1800)),
+    'max_history': int(os.environ.get('SESSION_MAX_HISTORY', 3))
+}
+if os.environ.get('SESSION_STORE', 'memory') == 'sqlite':
+    session_store = SQLiteSessionStore(os.environ.get('SESSION_DB', 'logs/sessions.db'), **session_store_options)
+else:
+    session_store = SessionStore(**session_store_options)
+session_store.start()
+
+metrics.REGISTRY.callback('chatbot_sessions_active', 'Sessions currently held by the session store',
+                          lambda: session_store.stats()['active'])
+metrics.REGISTRY.callback('chatbot_sessions_expired_total', 'Sessions expired after sitting idle',
+                          lambda: session_store.stats()['expired'], kind='counter')
+metrics.REGISTRY.callback('chatbot_log_queue_depth', 'Log entries waiting for the background writer',
+                          lambda: session_logger.stats()['queue_depth'])
+metrics.REGISTRY.callback('chatbot_log_dropped_entries_total', 'Log entries dropped on a full queue or write error',
+                          lambda: session_logger.stats()['dropped_entries'], kind='counter')
+metrics.REGISTRY.callback('chatbot_batch_queue_depth', 'Requests waiting for the batch scheduler',
+                          lambda: batch_scheduler.stats()['queue_depth'])
+metrics.REGISTRY.callback('chatbot_requests_rejected_total', 'Chat requests shed with 503 because the queue was full',
+                          lambda: batch_scheduler.stats()['rejected'], kind='counter')
+metrics.REGISTRY.callback('chatbot_context_truncations_total',
+                          'Prompts whose user input or oldest kept exchange was cut to fit the token budget',
+                          lambda: chatbot.context_stats['truncated_inputs'] + chatbot.context_stats['truncated_turns'],
+                          kind='counter')
+metrics.REGISTRY.callback('chatbot_context_dropped_turns_total', 'History exchanges left out of prompts by the token budget',
+                          lambda: chatbot.context_stats['dropped_turns'], kind='counter')
+if retrieval is not None:
+    metrics.REGISTRY.callback('chatbot_retrieval_queries_total', 'Messages looked up in the curated replies',
+                              lambda: retrieval.stats()['queries'], kind='counter')
+    metrics.REGISTRY.callback('chatbot_retrieval_hits_total', 'Messages answered with a curated reply instead of the model',
+                              lambda: retrieval.stats()['hits'], kind='counter')
+    metrics.REGISTRY.callback('chatbot_retrieval_seconds_saved_total',
+                              'Estimated generation time avoided by curated replies',
+                              lambda: retrieval.stats()['seconds_saved'], kind='counter')
+metrics.REGISTRY.callback('chatbot_model_ready', '1 once the model is loaded and warmed up',
+                          lambda: int(chatbot.is_ready))
+
+def on_worker_start(threads=None):
+    """Per-worker setup for pre-fork servers (called from gunicorn's post_fork hook)"""
+    if threads:
+        torch.set_num_threads(threads)
 
-# Store active sessions
-active_sessions = {}
+def sse_event(payload):
+    """Format a payload as a server-sent event"""
+    return f"data: {json.dumps(payload)}\n\n"
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: the model is loaded and warmed up"""
+    status = chatbot.status()
+    return jsonify(status), 200 if status['state'] == 'ready' else 503
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint.
+    
+    Metrics are kept per process and not aggregated, so they are only correct with a
+    single worker: under gunicorn every worker shares one port and each scrape reaches
+    whichever worker accepts it (gunicorn.conf.py warns when WEB_CONCURRENCY > 1).
+    """
+    if not metrics_enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+def prepare_chat(data):
+    """Validate a chat request, log the user turn and answer it directly if the content filter or a curated reply applies.
+    
+    Returns (session_id, session, user_input, response); response is None when the
+    model has to generate it, and a place is then held on the batch scheduler for
+    submit_chat or a stream. Raises ValueError for an empty message and SchedulerBusy
+    when the model is needed but its queue is full.
+    """
+    user_input = (data or {}).get('message', '').strip()
+    if not user_input:
+        raise ValueError('Empty message')
+    
+    # Check for offensive content
+    offensive = content_filter.is_offensive(user_input)
+    response = None if offensive else curated_reply(user_input)
+    # Shed before touching the session store or log, so a 503 leaves nothing behind
+    needs_model = not offensive and response is None
+    if needs_model:
+        batch_scheduler.reserve()
+    
     try:
-        data = request.json
-        user_input = data.get('message', '').strip()
-        session_id = data.get('session_id')
-        
-        if not user_input:
-            return jsonify({'error': 'Empty message'}), 400
-        
-        # Create new session if needed
-        if not session_id or session_id not in active_sessions:
-            session_id = str(uuid.uuid4())
-            active_sessions[session_id] = {
-                'history': [],
-                'created_at': datetime.now(),
-                'step': 0
-            }
-        
-        session = active_sessions[session_id]
+        with stage_timer.stage('session_store'):
+            session_id, session = session_store.get_or_create(data.get('session_id'))
         
         # Log user input
-        session_logger.log_interaction(session_id, 'user', user_input)
-        
-        # Check for offensive content
-        if content_filter.is_offensive(user_input):
-            response = content_filter.get_empathetic_response(session['step'])
-            session['step'] += 1
-        else:
-            # Generate response using the chatbot
-            response = chatbot.generate_response(user_input, session['history'])
-        
-        # Update session history
-        session['history'].append({'user': user_input, 'bot': response})
-        
-        # Log bot response
+        with stage_timer.stage('log_user'):
+            session_logger.log_interaction(session_id, 'user', user_input)
+    except Exception:
+        if needs_model:
+            batch_scheduler.release()
+        raise
+    
+    if offensive:
+        response = content_filter.get_empathetic_response(session.step)
+        session.step += 1
+    return session_id, session, user_input, response
+
+def curated_reply(user_input):
+    """Curated reply for a message close to a curated user turn, or None.
+    
+    A hit goes through the same enhance_response step as a generated reply.
+    """
+    if retrieval is None:
+        return None
+    with stage_timer.stage('retrieval'):
+        response = retrieval.respond(user_input)
+    return chatbot._enhance(response, user_input) if response is not None else None
+
+def request_deadline(started, header=None):
+    """time.perf_counter() deadline for a request: REQUEST_TIMEOUT, or a shorter X-Request-Timeout header"""
+    timeout = request_timeout
+    try:
+        if header:
+            timeout = min(timeout, float(header)) if timeout else float(header)
+    except ValueError:
+        pass
+    return started + timeout if timeout > 0 else None
+
+def submit_chat(session_id, session, user_input, deadline=None):
+    """Queue generation on the batch scheduler's inference thread, in the place prepare_chat reserved"""
+    # KV cache reuse is per session, so those requests are generated one at a time
+    return batch_scheduler.submit(user_input, session.history,
+                                  session_id=session_id if chatbot.kv_cache is not None else None,
+                                  deadline=deadline, reserved=True, session_turns=session.turns)
+
+def finish_chat(session_id, session, user_input, response, started, future=None):
+    """Record the exchange and build the JSON reply"""
+    if retrieval is not None and future is not None and future.queue_seconds is not None:
+        retrieval.observe_generation(future.queue_seconds + future.inference_seconds)
+    
+    # Update session history
+    session.add_exchange(user_input, response)
+    with stage_timer.stage('session_store'):
+        session_store.save(session_id, session)
+    
+    # Log bot response
+    with stage_timer.stage('log_bot'):
         session_logger.log_interaction(session_id, 'bot', response)
+    
+    metrics.REQUEST_SECONDS.labels('chat').observe(time.perf_counter() - started)
+    return {
+        'response': response,
+        'session_id': session_id,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def timing_headers(future):
+    """Server-Timing header separating queue wait from inference for a generated reply"""
+    if future is None or future.queue_seconds is None:
+        return {}
+    return {'Server-Timing': f'queue;dur={future.queue_seconds * 1000:.1f}, '
+                             f'inference;dur={future.inference_seconds * 1000:.1f}'}
+
+def busy_reply(error):
+    """JSON body, status and headers shedding a request the queue has no room for"""
+    return {'error': 'The server is busy, please retry shortly'}, 503, {'Retry-After': str(error.retry_after)}
+
+@app.route('/api/chat', methods=['POST'])
+def chat():
+    started = time.perf_counter()
+    try:
+        try:
+            session_id, session, user_input, response = prepare_chat(request.json)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        return jsonify({
-            'response': response,
-            'session_id': session_id,
-            'timestamp': datetime.now().isoformat()
-        })
-        
+        future = None
+        if response is None:
+            deadline = request_deadline(started, request.headers.get('X-Request-Timeout'))
+            future = submit_chat(session_id, session, user_input, deadline)
+            response = future.result()
+        return jsonify(finish_chat(session_id, session, user_input, response, started, future)), 200, timing_headers(future)
+    
+    except SchedulerBusy as e:
+        body, status, headers = busy_reply(e)
+        return jsonify(body), status, headers
     except Exception as e:
+        metrics.ERRORS.labels('api').inc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Stream the response as server-sent events while the model generates it.
+    
+    Generation runs on the request thread, so it holds one of the batch scheduler's
+    queue places until the response closes and is shed with 503 like /api/chat.
+    """
+    started = time.perf_counter()
+    deadline = request_deadline(started, request.headers.get('X-Request-Timeout'))
+    try:
+        session_id, session, user_input, response = prepare_chat(request.json)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except SchedulerBusy as e:
+        body, status, headers = busy_reply(e)
+        return jsonify(body), status, headers
+    generating = response is None
+    
+    def generate():
+        nonlocal response
+        yield sse_event({'session_id': session_id})
+        try:
+            if generating:
+                generate_started = time.perf_counter()
+                for kind, text in chatbot.stream_response(user_input, session.history, deadline):
+                    if kind == 'token':
+                        yield sse_event({'token': text})
+                    else:
+                        response = text
+                if retrieval is not None:
+                    retrieval.observe_generation(time.perf_counter() - generate_started)
+            
+            session.add_exchange(user_input, response)
+            session_store.save(session_id, session)
+            session_logger.log_interaction(session_id, 'bot', response)
+            
+            metrics.REQUEST_SECONDS.labels('chat_stream').observe(time.perf_counter() - started)
+            # The final event carries the enhanced response, which replaces the raw tokens
+            yield sse_event({
+                'done': True,
+                'response': response,
+                'session_id': session_id,
+                'timestamp': datetime.now().isoformat()
+            })
+        except Exception as e:
+            metrics.ERRORS.labels('api').inc()
+            yield sse_event({'done': True, 'error': str(e), 'session_id': session_id})
+    
+    stream = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    if generating:
+        # Closing runs even when the client leaves before the stream starts
+        stream.call_on_close(batch_scheduler.release)
+    return stream
+
 @app.route('/api/sessions', methods=['GET'])
 def get_sessions():
     """Get session statistics for monitoring"""
     return jsonify({
-        'active_sessions': len(active_sessions),
-        'total_logged_sessions': session_logger.get_session_count()
+        'active_sessions': len(session_store),
+        'session_store': session_store.stats(),
+        'total_logged_sessions': session_logger.get_session_count(),
+        'batching': batch_scheduler.stats(),
+        'kv_cache': chatbot.kv_cache.stats() if chatbot.kv_cache is not None else None,
+        'response_cache': chatbot.response_cache.stats() if chatbot.response_cache is not None else None,
+        'context': dict(chatbot.context_stats),
+        'retrieval': retrieval.stats() if retrieval is not None else None,
+        'deadlines': dict(chatbot.deadline_stats, wasted_seconds=round(chatbot.deadline_stats['wasted_seconds'], 3)),
+        'session_logger': session_logger.stats(),
+        'stages': stage_timer.snapshot() if stage_timer.enabled else None
     })
 
 if __name__ == '__main__':
@@ -0,0 +1,90 @@
+"""ASGI entry point: /api/chat awaits generation instead of holding a server thread.
+
+Run from the project root (needs uvicorn and asgiref: pip install -r requirements-asgi.txt):
+    uvicorn api.asgi:app --port 5000
+
+POST /api/chat is handled on the event loop: the request is queued on the batch
+scheduler's inference thread and awaited, so any number of waiting requests cost
+no server threads, and a full queue is answered with 503 and Retry-After at once.
+Every other route is served by the Flask app through asgiref's WSGI adapter.
+"""
+import asyncio
+import json
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+
+from api import api
+from model.batching import SchedulerBusy
+
+flask_app = WsgiToAsgi(api.app)
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_json(send, payload, status=200, headers=None):
+    body = json.dumps(payload).encode()
+    header_list = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    header_list += [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    await send({'type': 'http.response.start', 'status': status, 'headers': header_list})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def chat(scope, receive, send):
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    try:
+        try:
+            data = json.loads(await read_body(receive) or b'{}')
+            # Session store and log writes can block briefly, so they run off the event loop
+            session_id, session, user_input, response = await loop.run_in_executor(None, api.prepare_chat, data)
+        except ValueError as e:
+            await send_json(send, {'error': str(e)}, 400)
+            return
+        
+        future = None
+        if response is None:
+            headers = dict(scope['headers'])
+            deadline = api.request_deadline(started, headers.get(b'x-request-timeout', b'').decode())
+            future = api.submit_chat(session_id, session, user_input, deadline)
+            response = await asyncio.wrap_future(future)
+        payload = await loop.run_in_executor(None, api.finish_chat, session_id, session, user_input, response,
+                                             started, future)
+        await send_json(send, payload, 200, api.timing_headers(future))
+    
+    except SchedulerBusy as e:
+        body, status, headers = api.busy_reply(e)
+        await send_json(send, body, status, headers)
+    except Exception as e:
+        api.metrics.ERRORS.labels('api').inc()
+        await send_json(send, {'error': str(e)}, 500)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            api.batch_scheduler.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            api.batch_scheduler.stop()
+            api.session_logger.close()
+            api.session_store.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/api/chat' and scope['method'] == 'POST':
+        await chat(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
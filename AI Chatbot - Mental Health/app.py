@@ -1,8 +1,17 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from datetime import datetime
 
+# Client timeout, and the shorter latency budget the API is asked to answer within so a
+# slow generation comes back as a shortened reply rather than a client-side timeout
+REQUEST_TIMEOUT = 30
+DEADLINE_HEADERS = {"X-Request-Timeout": str(REQUEST_TIMEOUT - 5)}
+# Messages drawn on each rerun; older ones stay collapsed until requested a page at a time,
+# so a rerun costs the same however long the conversation gets
+HISTORY_PAGE = 20
+
 # Page configuration
 st.set_page_config(
     page_title="Mental Health AI Chatbot",
@@ -64,6 +73,14 @@ if 'messages' not in st.session_state:
     st.session_state.messages = []
 if 'session_id' not in st.session_state:
     st.session_state.session_id = None
+if 'visible_messages' not in st.session_state:
+    st.session_state.visible_messages = HISTORY_PAGE
+if 'http' not in st.session_state:
+    # One keep-alive connection pool per browser session instead of a new connection per message
+    http = requests.Session()
+    http.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+    http.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+    st.session_state.http = http
 
 # Sidebar
 with st.sidebar:
@@ -76,6 +93,12 @@ with st.sidebar:
         help="URL of the Flask API endpoint"
     )
     
+    stream_responses = st.checkbox(
+        "Stream responses",
+        value=True,
+        help="Show the reply as it is generated (uses the /stream variant of the endpoint)"
+    )
+    
     st.header("ℹ️ About")
     st.info("""
     This chatbot is designed to provide emotional support and a listening ear. 
@@ -96,6 +119,7 @@ with st.sidebar:
     if st.button("🗑️ Clear Chat"):
         st.session_state.messages = []
         st.session_state.session_id = None
+        st.session_state.visible_messages = HISTORY_PAGE
         st.rerun()
 
 # Main content
@@ -104,12 +128,41 @@ st.markdown('<div class="main-header"><h1>🧠 Mental Health Support Chatbot</h1
 # Display chat messages
 chat_container = st.container()
 
+def message_html(message):
+    css_class = "user-message" if message["role"] == "user" else "bot-message"
+    return f'<div class="{css_class}">{message["content"]}</div>'
+
 with chat_container:
-    for message in st.session_state.messages:
-        if message["role"] == "user":
-            st.markdown(f'<div class="user-message">{message["content"]}</div>', unsafe_allow_html=True)
-        else:
-            st.markdown(f'<div class="bot-message">{message["content"]}</div>', unsafe_allow_html=True)
+    messages = st.session_state.messages
+    hidden = max(0, len(messages) - st.session_state.visible_messages)
+    if hidden:
+        if st.button(f"Show earlier messages ({hidden} hidden)"):
+            st.session_state.visible_messages += HISTORY_PAGE
+            st.rerun()
+    # The visible window goes out as one element rather than one per message
+    if messages:
+        st.markdown(''.join(message_html(message) for message in messages[hidden:]), unsafe_allow_html=True)
+
+def stream_chat(url, payload, placeholder):
+    """Call the streaming endpoint and render the partial reply as chunks arrive"""
+    partial = ""
+    final = None
+    with st.session_state.http.post(url, json=payload, stream=True, headers=DEADLINE_HEADERS,
+                                    timeout=REQUEST_TIMEOUT) as response:
+        if response.status_code != 200:
+            return response.status_code, None
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            if "session_id" in event:
+                st.session_state.session_id = event["session_id"]
+            if "token" in event:
+                partial += event["token"]
+                placeholder.markdown(f'<div class="bot-message">{partial}▌</div>', unsafe_allow_html=True)
+            if event.get("done"):
+                final = event.get("response")
+    return 200, final
 
 # Chat input
 user_input = st.chat_input("Share what's on your mind...")
@@ -117,6 +170,8 @@ user_input = st.chat_input("Share what's on your mind...")
 if user_input:
     # Add user message to chat
     st.session_state.messages.append({"role": "user", "content": user_input})
+    # Collapse any earlier pages the user opened, so later reruns draw only the latest window again
+    st.session_state.visible_messages = HISTORY_PAGE
     
     # Prepare API request
     payload = {
@@ -126,18 +181,28 @@ if user_input:
     
     try:
         # Make API request
-        with st.spinner("Thinking..."):
-            response = requests.post(api_url, json=payload, timeout=30)
+        if stream_responses:
+            with chat_container:
+                st.markdown(f'<div class="user-message">{user_input}</div>', unsafe_allow_html=True)
+                placeholder = st.empty()
+            status_code, bot_response = stream_chat(api_url.rstrip('/') + '/stream', payload, placeholder)
+        else:
+            with st.spinner("Thinking..."):
+                response = st.session_state.http.post(api_url, json=payload, headers=DEADLINE_HEADERS,
+                                                      timeout=REQUEST_TIMEOUT)
+            status_code, bot_response = response.status_code, None
+            if status_code == 200:
+                data = response.json()
+                bot_response = data.get('response')
+                st.session_state.session_id = data.get('session_id')
         
-        if response.status_code == 200:
-            data = response.json()
-            bot_response = data.get('response', 'I apologize, but I had trouble generating a response.')
-            st.session_state.session_id = data.get('session_id')
+        if status_code == 200:
+            bot_response = bot_response or 'I apologize, but I had trouble generating a response.'
             
             # Add bot response to chat
             st.session_state.messages.append({"role": "assistant", "content": bot_response})
         else:
-            st.error(f"API Error: {response.status_code}")
+            st.error(f"API Error: {status_code}")
             st.session_state.messages.append({
                 "role": "assistant", 
                 "content": "I'm sorry, I'm having technical difficulties. Please try again."
@@ -0,0 +1,164 @@
+"""Assisted decoding benchmark: draft-token acceptance rate and speedup over plain decoding.
+
+Every user turn in data/mental_health_conversations.json is turned into a
+prompt with the preceding exchanges as context, exactly as the chatbot builds
+them, and generated once without and once with the draft model. Acceptance
+is estimated from forward-call counts: each verification step of the main
+model accepts (tokens produced - 1) of the tokens the draft proposed. Greedy
+decoding is used by default, so both modes should produce identical text.
+Run from the project root:
+    python -m benchmarks.assisted_decoding_bench --draft-model-name microsoft/DialoGPT-small
+"""
+import argparse
+import json
+import os
+import time
+
+import torch
+
+from benchmarks.stats import percentile
+from model.chatbot_model import MentalHealthChatbot
+
+
+def load_prompts(path):
+    """(user_input, history) for every user turn, with the exchanges before it as history"""
+    with open(path) as f:
+        conversations = json.load(f)['conversations']
+    
+    prompts = []
+    for conversation in conversations:
+        history = []
+        pending_user = None
+        for turn in conversation['conversation']:
+            if turn['speaker'] == 'user':
+                pending_user = turn['text']
+                prompts.append((pending_user, list(history)))
+            elif pending_user is not None:
+                history.append({'user': pending_user, 'bot': turn['text']})
+                pending_user = None
+    return prompts
+
+
+class ForwardCounter:
+    """Counts forward passes of a model through a forward hook"""
+    
+    def __init__(self, model):
+        self.calls = 0
+        self._handle = model.register_forward_hook(self._hook)
+    
+    def _hook(self, module, inputs, output):
+        self.calls += 1
+    
+    def remove(self):
+        self._handle.remove()
+
+
+def run_mode(chatbot, prompts, args, assisted):
+    tokenizer = chatbot.tokenizer
+    main_counter = ForwardCounter(chatbot.model)
+    draft_counter = ForwardCounter(chatbot.draft_model) if assisted else None
+    
+    outputs = []
+    latencies = []
+    generated_tokens = 0
+    try:
+        for index, (user_input, history) in enumerate(prompts):
+            input_ids = torch.tensor([chatbot._encode_prompt(user_input, history)])
+            generate_kwargs = {'do_sample': True, 'temperature': 0.7} if args.sample else {'do_sample': False}
+            if assisted:
+                generate_kwargs.update(chatbot._assisted_kwargs())
+            torch.manual_seed(args.seed + index)
+            
+            started = time.perf_counter()
+            with torch.no_grad():
+                output = chatbot.model.generate(
+                    input_ids,
+                    attention_mask=torch.ones(input_ids.shape, dtype=torch.long),
+                    max_new_tokens=args.max_new_tokens,
+                    pad_token_id=tokenizer.eos_token_id,
+                    **generate_kwargs
+                )
+            latencies.append(time.perf_counter() - started)
+            new_tokens = output[0][input_ids.shape[1]:].tolist()
+            generated_tokens += len(new_tokens)
+            outputs.append(new_tokens)
+    finally:
+        main_counter.remove()
+        if draft_counter is not None:
+            draft_counter.remove()
+    
+    report = {
+        'mode': 'assisted' if assisted else 'plain',
+        'total_seconds': round(sum(latencies), 3),
+        'tokens_per_second': round(generated_tokens / sum(latencies), 2),
+        'p50_latency_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_latency_ms': round(percentile(latencies, 95) * 1000, 1),
+        'generated_tokens': generated_tokens,
+        'main_forward_passes': main_counter.calls,
+    }
+    if assisted:
+        accepted = max(0, generated_tokens - main_counter.calls)
+        report.update({
+            'draft_forward_passes': draft_counter.calls,
+            'accepted_draft_tokens': accepted,
+            'acceptance_rate': round(accepted / draft_counter.calls, 3) if draft_counter.calls else 0.0,
+            'tokens_per_main_forward': round(generated_tokens / main_counter.calls, 2) if main_counter.calls else 0.0,
+        })
+    return report, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model-name', default=os.environ.get('MODEL_NAME', 'microsoft/DialoGPT-medium'))
+    parser.add_argument('--draft-model-name', default=os.environ.get('DRAFT_MODEL_NAME', 'microsoft/DialoGPT-small'))
+    parser.add_argument('--data', default='data/mental_health_conversations.json')
+    parser.add_argument('--max-new-tokens', type=int, default=40)
+    parser.add_argument('--sample', action='store_true', help='sample (temperature 0.7) instead of greedy decoding')
+    parser.add_argument('--threads', type=int, default=0, help='torch intra-op threads (0 keeps the default)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='optional path for the JSON report')
+    args = parser.parse_args()
+    
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    chatbot = MentalHealthChatbot(model_name=args.model_name, draft_model_name=args.draft_model_name)
+    if chatbot.model is None:
+        raise SystemExit(f"Could not load {args.model_name}: {chatbot.load_error}")
+    if chatbot.draft_model is None:
+        raise SystemExit(f"Could not load draft model {args.draft_model_name}; nothing to compare")
+    
+    prompts = load_prompts(args.data)
+    # One untimed generation per mode so lazy initialisation isn't measured
+    run_mode(chatbot, prompts[:1], args, assisted=False)
+    run_mode(chatbot, prompts[:1], args, assisted=True)
+    
+    plain, plain_outputs = run_mode(chatbot, prompts, args, assisted=False)
+    assisted, assisted_outputs = run_mode(chatbot, prompts, args, assisted=True)
+    speedup = plain['total_seconds'] / assisted['total_seconds'] if assisted['total_seconds'] else 0.0
+    identical = sum(1 for a, b in zip(plain_outputs, assisted_outputs) if a == b)
+    
+    print(f"{len(prompts)} prompts, {args.model_name} verified against draft {args.draft_model_name}")
+    print(f"{'mode':9s} {'tok/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'fwd':>6s}")
+    for report in (plain, assisted):
+        print(f"{report['mode']:9s} {report['tokens_per_second']:8.1f} {report['p50_latency_ms']:9.1f} "
+              f"{report['p95_latency_ms']:9.1f} {report['main_forward_passes']:6d}")
+    print(f"acceptance rate {assisted['acceptance_rate']:.1%}, "
+          f"{assisted['tokens_per_main_forward']} tokens per main-model forward, speedup {speedup:.2f}x, "
+          f"{identical}/{len(prompts)} identical outputs")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'model_name': args.model_name,
+                'draft_model_name': args.draft_model_name,
+                'prompts': len(prompts),
+                'sample': args.sample,
+                'max_new_tokens': args.max_new_tokens,
+                'modes': [plain, assisted],
+                'speedup': round(speedup, 3),
+                'identical_outputs': identical,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""End-to-end /api/chat benchmark: latency percentiles, throughput and a per-stage breakdown.
+
+Drives api/api.py either in-process through the Flask test client
+(--target client), as a single-worker gunicorn server (--target server) or
+as the uvicorn ASGI server of api/asgi.py (--target asgi),
+from --concurrency clients that each replay the user turns of a curated
+conversation from data/mental_health_conversations.json in their own session.
+With --model stub, a tiny randomly initialised GPT-2 model with a word-level
+tokenizer is built in a temporary directory, so the measured time is the
+pipeline around the model rather than DialoGPT itself; --model real serves
+MODEL_NAME. Per-stage times come from the server's PROFILE_STAGES timers.
+Logs and the session database go to a temporary directory. Run from the
+project root:
+    python -m benchmarks.chat_api_bench --model stub --concurrency 8 --requests 400 --output chat_api.json
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.stats import percentile
+
+STAGES = ['session_store', 'log_user', 'content_filter', 'tokenize', 'generate', 'decode',
+          'enhance_response', 'log_bot']
+
+
+def load_conversations(path):
+    """User turns of every curated conversation"""
+    with open(path) as f:
+        conversations = json.load(f)['conversations']
+    return [
+        [turn['text'] for turn in conversation['conversation'] if turn['speaker'] == 'user']
+        for conversation in conversations
+    ]
+
+
+def build_stub_model(directory, texts):
+    """Save a tiny random GPT-2 model and a word-level tokenizer over the words in texts"""
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+    
+    words = sorted({word for text in texts for word in re.findall(r"\w+|[^\w\s]", text.lower())})
+    vocab = {'<|endoftext|>': 0, '[UNK]': 1}
+    for word in words:
+        vocab.setdefault(word, len(vocab))
+    
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token='[UNK]'))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, eos_token='<|endoftext|>', unk_token='[UNK]'
+    ).save_pretrained(directory)
+    
+    config = GPT2Config(vocab_size=len(vocab), n_positions=1024, n_embd=64, n_layer=2, n_head=2,
+                        bos_token_id=0, eos_token_id=0)
+    GPT2LMHeadModel(config).save_pretrained(directory)
+
+
+def stage_breakdown(before, after, requests):
+    """Per-stage counts and times accumulated between two /api/sessions stage snapshots"""
+    breakdown = {}
+    for name in STAGES + sorted(set(after) - set(STAGES)):
+        count = after.get(name, {}).get('count', 0) - before.get(name, {}).get('count', 0)
+        total_ms = after.get(name, {}).get('total_ms', 0.0) - before.get(name, {}).get('total_ms', 0.0)
+        if count:
+            breakdown[name] = {
+                'count': count,
+                'total_ms': round(total_ms, 3),
+                'mean_ms': round(total_ms / count, 3),
+                'ms_per_request': round(total_ms / requests, 3) if requests else 0.0,
+            }
+    return breakdown
+
+
+class InProcessTarget:
+    """api.api imported into this process and called through Flask test clients"""
+    
+    def __init__(self, timeout):
+        import api.api
+        
+        self.api = api.api
+        self._local = threading.local()
+        if not self.api.chatbot.ready.wait(timeout):
+            raise SystemExit(f"Model did not become ready: {self.api.chatbot.status()}")
+    
+    def chat(self, message, session_id):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.api.app.test_client()
+        response = client.post('/api/chat', json={'message': message, 'session_id': session_id})
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return response.get_json()['session_id']
+    
+    def stages(self):
+        return self.api.stage_timer.snapshot()
+    
+    def close(self):
+        self.api.session_logger.close()
+        self.api.session_store.stop()
+
+
+class ServerTarget:
+    """A single-process server (gunicorn with one worker, or uvicorn), so every request is timed by the same process"""
+    
+    def __init__(self, port, threads, timeout, asgi=False):
+        self.base_url = f'http://127.0.0.1:{port}'
+        env = dict(os.environ, WEB_CONCURRENCY='1', GUNICORN_THREADS=str(threads), PORT=str(port))
+        if asgi:
+            command = ['uvicorn', 'api.asgi:app', '--port', str(port), '--log-level', 'warning']
+        else:
+            command = ['gunicorn', '-c', 'gunicorn.conf.py', 'api.api:app']
+        self.process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                with urllib.request.urlopen(f'{self.base_url}/readyz', timeout=1) as response:
+                    if response.status == 200:
+                        return
+            except (urllib.error.URLError, ConnectionError, OSError):
+                pass
+            time.sleep(0.2)
+        self.close()
+        raise SystemExit('Server did not become ready')
+    
+    def chat(self, message, session_id):
+        body = json.dumps({'message': message, 'session_id': session_id}).encode()
+        request = urllib.request.Request(f'{self.base_url}/api/chat', data=body,
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=300) as response:
+            return json.loads(response.read())['session_id']
+    
+    def stages(self):
+        with urllib.request.urlopen(f'{self.base_url}/api/sessions', timeout=30) as response:
+            return json.loads(response.read())['stages'] or {}
+    
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def drive_load(target, conversations, concurrency, total_requests):
+    """Each client replays a conversation in one session, then starts the next conversation in a new one"""
+    latencies = []
+    errors = [0]
+    remaining = [total_requests]
+    lock = threading.Lock()
+    
+    def client(index):
+        conversation_index = index
+        while True:
+            session_id = None
+            for message in conversations[conversation_index % len(conversations)]:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                started = time.perf_counter()
+                try:
+                    session_id = target.chat(message, session_id)
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+            conversation_index += concurrency
+    
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', choices=['client', 'server', 'asgi'], default='client')
+    parser.add_argument('--model', choices=['stub', 'real'], default='stub')
+    parser.add_argument('--model-name', default=None, help='model for --model real (overrides MODEL_NAME)')
+    parser.add_argument('--data', default='data/mental_health_conversations.json')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10, help='untimed requests sent first')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads for --target server')
+    parser.add_argument('--port', type=int, default=5057)
+    parser.add_argument('--timeout', type=float, default=600, help='seconds to wait for the model to load')
+    parser.add_argument('--output', default=None, help='optional path for the JSON report')
+    args = parser.parse_args()
+    
+    conversations = load_conversations(args.data)
+    workdir = tempfile.mkdtemp(prefix='chat_api_bench-')
+    os.environ.update({
+        'PROFILE_STAGES': '1',
+        'LOG_FILE': os.path.join(workdir, 'user_sessions.log'),
+        'SESSION_DB': os.path.join(workdir, 'sessions.db'),
+    })
+    # The replayed messages are the curated turns themselves, so by default measure the model path
+    # rather than curated replies (RETRIEVAL_ENABLED=1 benchmarks the retrieval fast path)
+    os.environ.setdefault('RETRIEVAL_ENABLED', '0')
+    if args.model == 'stub':
+        build_stub_model(os.path.join(workdir, 'stub'), [text for turns in conversations for text in turns])
+        os.environ['MODEL_NAME'] = os.path.join(workdir, 'stub')
+    elif args.model_name:
+        os.environ['MODEL_NAME'] = args.model_name
+    
+    target = None
+    try:
+        if args.target == 'client':
+            target = InProcessTarget(args.timeout)
+        else:
+            target = ServerTarget(args.port, args.threads, args.timeout, asgi=args.target == 'asgi')
+        
+        drive_load(target, conversations, min(args.concurrency, args.warmup or 1), args.warmup)
+        before = target.stages()
+        latencies, errors, elapsed = drive_load(target, conversations, args.concurrency, args.requests)
+        after = target.stages()
+    finally:
+        if target is not None:
+            target.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    if not latencies:
+        raise SystemExit(f"All {errors} requests failed")
+    
+    report = {
+        'config': {
+            'target': args.target,
+            'model': args.model,
+            'model_name': args.model_name if args.model == 'real' else 'stub',
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'env': {name: os.environ[name] for name in sorted(os.environ)
+                    if name.split('_')[0] in ('BATCH', 'KV', 'RESPONSE', 'RETRIEVAL', 'SESSION', 'LOG', 'MODEL', 'DRAFT')
+                    and name not in ('LOG_FILE', 'SESSION_DB', 'MODEL_NAME')},
+        },
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 2),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 2),
+            'p50': round(percentile(latencies, 50) * 1000, 2),
+            'p95': round(percentile(latencies, 95) * 1000, 2),
+            'p99': round(percentile(latencies, 99) * 1000, 2),
+        },
+        'stages': stage_breakdown(before, after, len(latencies)),
+    }
+    
+    latency = report['latency_ms']
+    print(f"{report['requests']} requests ({errors} errors) at concurrency {args.concurrency}: "
+          f"{report['requests_per_second']:.1f} req/s, p50 {latency['p50']:.1f} ms, "
+          f"p95 {latency['p95']:.1f} ms, p99 {latency['p99']:.1f} ms")
+    print(f"{'stage':17s} {'count':>7s} {'mean ms':>9s} {'ms/req':>9s}")
+    for name, stage in report['stages'].items():
+        print(f"{name:17s} {stage['count']:7d} {stage['mean_ms']:9.3f} {stage['ms_per_request']:9.3f}")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
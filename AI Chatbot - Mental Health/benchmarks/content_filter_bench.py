@@ -0,0 +1,89 @@
+"""Microbenchmark: precompiled ContentFilter vs the original per-call implementation.
+
+Run from the project root:
+    python -m benchmarks.content_filter_bench --messages 20000
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+from nltk.corpus import stopwords
+
+from utils.content_filter import ContentFilter
+
+
+class LegacyContentFilter:
+    """The original checks: stopwords reloaded and text re-tokenized on every call"""
+    
+    def __init__(self, offensive_words, mental_health_keywords):
+        self.offensive_words = offensive_words
+        self.mental_health_keywords = mental_health_keywords
+    
+    def is_offensive(self, text):
+        cleaned = re.sub(r"[^a-zA-Z ]", "", text.lower())
+        tokens = set(cleaned.split()) - set(stopwords.words('english'))
+        return bool(tokens & self.offensive_words)
+    
+    def contains_mental_health_keywords(self, text):
+        cleaned = re.sub(r"[^a-zA-Z ]", "", text.lower())
+        tokens = set(cleaned.split())
+        return bool(tokens & self.mental_health_keywords)
+
+
+def load_messages(count, seed):
+    """Sample user turns from the curated conversations"""
+    with open('data/mental_health_conversations.json', 'r') as f:
+        conversations = json.load(f)['conversations']
+    texts = [
+        turn['text']
+        for conv in conversations
+        for turn in conv['conversation']
+        if turn['speaker'] == 'user'
+    ]
+    texts += ["I feel worthless and hopeless", "hello, how are you today?", "I had a panic attack at work"]
+    rng = random.Random(seed)
+    return [rng.choice(texts) for _ in range(count)]
+
+
+def timed(fn, messages):
+    started = time.perf_counter()
+    fn(messages)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    messages = load_messages(args.messages, args.seed)
+    current = ContentFilter()
+    legacy = LegacyContentFilter(current.offensive_words, current.mental_health_keywords)
+    
+    # Both classify every message the same way (unless phrases have been added)
+    mismatches = sum(
+        (legacy.is_offensive(m), legacy.contains_mental_health_keywords(m)) != tuple(current.analyze(m).values())
+        for m in set(messages)
+    )
+    
+    results = {
+        'legacy (two calls per message)': timed(
+            lambda ms: [(legacy.is_offensive(m), legacy.contains_mental_health_keywords(m)) for m in ms],
+            messages
+        ),
+        'analyze (one call per message)': timed(lambda ms: [current.analyze(m) for m in ms], messages),
+        'classify_batch': timed(current.classify_batch, messages),
+    }
+    
+    baseline = results['legacy (two calls per message)']
+    print(f"{len(messages)} messages, {mismatches} classification mismatches")
+    for name, seconds in results.items():
+        print(f"{name:32s} {seconds * 1000:9.1f} ms  {len(messages) / seconds:12.0f} msg/s  "
+              f"{baseline / seconds:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Fine-tuning data pipeline benchmark: padding ratio and training tokens/sec per batching strategy.
+
+Compares the original pipeline (padding=True inside map, so every conversation
+is padded to the longest in its 1000-example map batch) with the streaming
+pipeline's three strategies: dynamic per-batch padding in random order,
+length-grouped batches, and packing into full --block-size blocks. The
+padding ratio is measured over one epoch of batches; tokens/sec comes from
+--steps real optimizer steps on the model and counts only non-padding tokens.
+Run from the project root:
+    python -m benchmarks.finetune_data_bench --data data/mental_health_conversations.json --steps 20
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import torch
+
+from model.fine_tuning import CausalLMCollator, MentalHealthFineTuner, iter_conversations
+
+MODES = ('baseline', 'dynamic', 'grouped', 'packed')
+
+
+def original_tokenize(tuner, dataset):
+    """The pre-streaming tokenization: truncated and padded to the longest example of each map batch"""
+    return dataset.map(
+        lambda examples: tuner.tokenizer(examples['text'], truncation=True, padding=True,
+                                         max_length=tuner.block_size),
+        batched=True, remove_columns=['text']
+    )
+
+
+def batch_order(mode, lengths, batch_size, seed):
+    """Example indices in the order the trainer's sampler would draw them"""
+    if mode == 'grouped':
+        from transformers.trainer_pt_utils import LengthGroupedSampler
+        generator = torch.Generator().manual_seed(seed)
+        return list(LengthGroupedSampler(batch_size, lengths=lengths, generator=generator))
+    order = list(range(len(lengths)))
+    random.Random(seed).shuffle(order)
+    return order
+
+
+def run_mode(tuner, dataset, mode, args):
+    if mode == 'baseline':
+        tokenized = original_tokenize(tuner, dataset)
+    else:
+        tokenized = tuner.tokenize_dataset(dataset, pack=(mode == 'packed'))
+    features = [{'input_ids': ids} for ids in tokenized['input_ids']]
+    lengths = [len(feature['input_ids']) for feature in features]
+    # The baseline already padded at map time, so its collator adds nothing
+    collator = CausalLMCollator(tuner.tokenizer, pad_to_multiple_of=None if mode == 'baseline' else 8)
+    
+    order = batch_order(mode, lengths, args.batch_size, args.seed)
+    batches = [order[i:i + args.batch_size] for i in range(0, len(order), args.batch_size)]
+    
+    # Padding over a full epoch; for the baseline, map-time padding counts as padding too
+    if mode == 'baseline':
+        real_lengths = [sum(mask) for mask in tokenized['attention_mask']]
+    else:
+        real_lengths = lengths
+    real_tokens = sum(real_lengths)
+    total_tokens = 0
+    for batch in batches:
+        padded = collator([features[i] for i in batch])['input_ids']
+        total_tokens += padded.numel()
+    
+    # Training throughput over the first --steps batches, cycling if the epoch is shorter
+    model = tuner.model
+    model.train()
+    optimizer = torch.optim.AdamW(model.parameters(), lr=5e-5)
+    trained_real = trained_total = 0
+    started = time.perf_counter()
+    for step in range(args.steps):
+        batch = batches[step % len(batches)]
+        collated = collator([features[i] for i in batch])
+        if mode == 'baseline':
+            # Map-time padding is real input to the baseline, but mask it like the original collator did
+            mask = torch.tensor([tokenized['attention_mask'][i] for i in batch], dtype=torch.long)
+            collated['attention_mask'] = mask
+            collated['labels'] = collated['input_ids'].masked_fill(mask == 0, -100)
+        loss = model(**collated).loss
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+        trained_real += int(collated['attention_mask'].sum())
+        trained_total += collated['input_ids'].numel()
+    elapsed = time.perf_counter() - started
+    
+    return {
+        'mode': mode,
+        'examples': len(features),
+        'batches_per_epoch': len(batches),
+        'real_tokens': real_tokens,
+        'padded_tokens': total_tokens,
+        'padding_ratio': round(1 - real_tokens / total_tokens, 4) if total_tokens else 0.0,
+        'train_steps': args.steps,
+        'real_tokens_per_second': round(trained_real / elapsed, 1),
+        'total_tokens_per_second': round(trained_total / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model-name', default=os.environ.get('MODEL_NAME', 'microsoft/DialoGPT-medium'))
+    parser.add_argument('--data', default='data/mental_health_conversations.json')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='replicate the conversations (with varied turn counts) to get a larger corpus')
+    parser.add_argument('--block-size', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='optional path for the JSON report')
+    args = parser.parse_args()
+    
+    torch.manual_seed(args.seed)
+    tuner = MentalHealthFineTuner(args.model_name, block_size=args.block_size)
+    initial_state = {name: tensor.clone() for name, tensor in tuner.model.state_dict().items()}
+    
+    data_path = args.data
+    workdir = None
+    if args.repeat > 1:
+        # Write the enlarged corpus as JSONL, truncating conversations to varied lengths
+        workdir = tempfile.mkdtemp(prefix='finetune_data_bench-')
+        data_path = os.path.join(workdir, 'conversations.jsonl')
+        rng = random.Random(args.seed)
+        conversations = list(iter_conversations(args.data))
+        with open(data_path, 'w') as f:
+            for _ in range(args.repeat):
+                for conversation in conversations:
+                    turns = conversation['conversation'][:rng.randint(2, len(conversation['conversation']))]
+                    f.write(json.dumps({'conversation': turns}) + '\n')
+    
+    dataset = tuner.prepare_dataset(data_path)
+    reports = []
+    for mode in MODES:
+        # Every mode trains from the same initial weights
+        tuner.model.load_state_dict(initial_state)
+        reports.append(run_mode(tuner, dataset, mode, args))
+    
+    print(f"{len(dataset)} conversations, batch size {args.batch_size}, block size {args.block_size}")
+    print(f"{'mode':9s} {'examples':>8s} {'padding':>8s} {'real tok/s':>11s} {'all tok/s':>10s}")
+    for report in reports:
+        print(f"{report['mode']:9s} {report['examples']:8d} {report['padding_ratio']:8.1%} "
+              f"{report['real_tokens_per_second']:11.1f} {report['total_tokens_per_second']:10.1f}")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'model_name': args.model_name, 'conversations': len(dataset),
+                       'batch_size': args.batch_size, 'block_size': args.block_size, 'modes': reports}, f, indent=2)
+    if workdir is not None:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
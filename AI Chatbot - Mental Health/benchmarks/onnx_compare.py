@@ -0,0 +1,156 @@
+"""Compare the torch and ONNX Runtime backends: output parity and CPU speed on fixed prompts and seeds.
+
+Each backend runs in its own subprocess so resident memory is measured in
+isolation. Every prompt is decoded greedily (timed over --repeats) and once
+with the chatbot's sampling settings under a per-prompt torch seed; both
+backends sample with torch's RNG, so matching logits give matching replies.
+Without --onnx-dir the model is exported to a temporary directory first.
+Run from the project root:
+    python -m benchmarks.onnx_compare --max-new-tokens 40 --repeats 3 --output onnx.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.quantization_compare import DEFAULT_PROMPTS, common_prefix, resident_memory_mb, token_agreement
+from benchmarks.stats import percentile
+
+
+def run_mode(args):
+    """Worker: load one backend, generate for every prompt and print a JSON report"""
+    import torch
+    from model.chatbot_model import MentalHealthChatbot
+    
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model_name = args.onnx_dir if args.mode == 'onnx' else args.model_name
+    chatbot = MentalHealthChatbot(model_name=model_name, backend=args.mode)
+    if chatbot.model is None:
+        raise SystemExit(f"Failed to load the {args.mode} backend: {chatbot.load_error}")
+    if args.mode == 'onnx' and args.threads:
+        from model.onnx_model import OnnxCausalLM
+        chatbot.model = OnnxCausalLM(args.onnx_dir, threads=args.threads)
+    tokenizer, model = chatbot.tokenizer, chatbot.model
+    memory_mb = resident_memory_mb()
+    
+    def generate(input_ids, do_sample):
+        with torch.no_grad():
+            output = model.generate(
+                input_ids,
+                attention_mask=torch.ones(input_ids.shape, dtype=torch.long),
+                max_new_tokens=args.max_new_tokens,
+                do_sample=do_sample,
+                temperature=0.7 if do_sample else None,
+                pad_token_id=tokenizer.eos_token_id
+            )
+        return output[0][input_ids.shape[1]:].tolist()
+    
+    greedy = []
+    sampled = []
+    latencies = []
+    generated_tokens = 0
+    for repeat in range(args.repeats):
+        for prompt in args.prompts:
+            input_ids = tokenizer.encode(prompt + tokenizer.eos_token, return_tensors='pt')
+            started = time.perf_counter()
+            new_tokens = generate(input_ids, False)
+            latencies.append(time.perf_counter() - started)
+            generated_tokens += len(new_tokens)
+            if repeat == 0:
+                greedy.append(new_tokens)
+    for index, prompt in enumerate(args.prompts):
+        input_ids = tokenizer.encode(prompt + tokenizer.eos_token, return_tensors='pt')
+        torch.manual_seed(args.seed + index)
+        sampled.append(generate(input_ids, True))
+    
+    print(json.dumps({
+        'backend': args.mode,
+        'load_seconds': chatbot.load_seconds,
+        'resident_memory_mb': round(memory_mb, 1),
+        'peak_memory_mb': round(resident_memory_mb(), 1),
+        'tokens_per_second': round(generated_tokens / sum(latencies), 2),
+        'p50_latency_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_latency_ms': round(percentile(latencies, 95) * 1000, 1),
+        'greedy': greedy,
+        'sampled': sampled,
+    }))
+
+
+def parity(reference, candidate):
+    agreement = [token_agreement(r, c) for r, c in zip(reference, candidate)]
+    return {
+        'mean_token_agreement': round(sum(agreement) / len(agreement), 3),
+        'identical_outputs': sum(1 for r, c in zip(reference, candidate) if r == c),
+        'mean_common_prefix_tokens': round(
+            sum(common_prefix(r, c) for r, c in zip(reference, candidate)) / len(reference), 1
+        ),
+        'prompts': len(reference),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model-name', default=os.environ.get('MODEL_NAME', 'microsoft/DialoGPT-medium'))
+    parser.add_argument('--onnx-dir', default=None, help='existing export of --model-name (python -m model.onnx_model)')
+    parser.add_argument('--max-new-tokens', type=int, default=40)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=0, help='intra-op threads for both backends (0 keeps the defaults)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='optional path for the JSON report')
+    parser.add_argument('--mode', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.prompts = DEFAULT_PROMPTS
+    
+    if args.mode:
+        run_mode(args)
+        return
+    
+    workdir = None
+    if args.onnx_dir is None:
+        from model.onnx_model import export_model
+        workdir = tempfile.mkdtemp(prefix='onnx_compare-')
+        args.onnx_dir = workdir
+        export_model(args.model_name, workdir)
+    
+    reports = {}
+    try:
+        for mode in ('torch', 'onnx'):
+            command = [sys.executable, '-m', 'benchmarks.onnx_compare', '--mode', mode,
+                       '--model-name', args.model_name, '--onnx-dir', args.onnx_dir,
+                       '--max-new-tokens', str(args.max_new_tokens), '--repeats', str(args.repeats),
+                       '--threads', str(args.threads), '--seed', str(args.seed)]
+            result = subprocess.run(command, capture_output=True, text=True, check=True)
+            reports[mode] = json.loads(result.stdout.strip().splitlines()[-1])
+    finally:
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    divergence = {
+        'greedy': parity(reports['torch']['greedy'], reports['onnx']['greedy']),
+        'sampled': parity(reports['torch']['sampled'], reports['onnx']['sampled']),
+    }
+    
+    print(f"{'backend':8s} {'tok/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'RSS MB':>8s}")
+    for mode, report in reports.items():
+        print(f"{mode:8s} {report['tokens_per_second']:8.1f} {report['p50_latency_ms']:9.1f} "
+              f"{report['p95_latency_ms']:9.1f} {report['resident_memory_mb']:8.1f}")
+    print(f"onnx speedup: {reports['onnx']['tokens_per_second'] / reports['torch']['tokens_per_second']:.2f}x tokens/sec")
+    for name, result in divergence.items():
+        print(f"{name}: {result['identical_outputs']}/{result['prompts']} identical outputs, "
+              f"{result['mean_token_agreement']:.1%} token agreement")
+    
+    if args.output:
+        for report in reports.values():
+            report.pop('greedy')
+            report.pop('sampled')
+        with open(args.output, 'w') as f:
+            json.dump({'model_name': args.model_name, 'backends': reports, 'parity': divergence}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Pre-fork serving benchmark: memory per worker and throughput as the gunicorn worker count grows.
+
+For each worker count, starts `gunicorn -c gunicorn.conf.py api.api:app`, waits
+for readiness, reads every worker's memory from /proc/<pid>/smaps_rollup and
+drives /api/chat from concurrent clients for a fixed duration. Linux only.
+Run from the project root:
+    python -m benchmarks.prefork_bench --workers 1 2 4 --clients 8 --duration 30
+"""
+import argparse
+import json
+import os
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+
+PROMPTS = [
+    "I've been feeling really anxious lately",
+    "I feel so lonely even when I'm around people",
+    "I'm having trouble sleeping",
+    "Work has been overwhelming",
+]
+
+
+def wait_ready(base_url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f'{base_url}/readyz', timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def child_pids(pid):
+    pids = []
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children') as f:
+            pids.extend(int(child) for child in f.read().split())
+    return pids
+
+
+def memory_mb(pid):
+    """Rss, Pss, shared and private memory of a process in MB"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        'rss': round(fields.get('Rss', 0), 1),
+        'pss': round(fields.get('Pss', 0), 1),
+        'shared': round(fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0), 1),
+        'private': round(fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0), 1),
+    }
+
+
+def post_chat(base_url, message, session_id):
+    body = json.dumps({'message': message, 'session_id': session_id}).encode()
+    request = urllib.request.Request(f'{base_url}/api/chat', data=body,
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return json.loads(response.read())
+
+
+def drive_load(base_url, clients, duration):
+    """Each client keeps its own session; returns (completed requests, errors, elapsed seconds)"""
+    completed = [0] * clients
+    errors = [0] * clients
+    stop_at = time.perf_counter() + duration
+    
+    def client(index):
+        session_id = None
+        turn = 0
+        while time.perf_counter() < stop_at:
+            try:
+                session_id = post_chat(base_url, PROMPTS[(index + turn) % len(PROMPTS)], session_id)['session_id']
+                completed[index] += 1
+            except (urllib.error.URLError, ConnectionError, OSError, ValueError, KeyError):
+                errors[index] += 1
+            turn += 1
+    
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(completed), sum(errors), time.perf_counter() - started
+
+
+def run(workers, args):
+    env = dict(os.environ)
+    env.update({'WEB_CONCURRENCY': str(workers), 'PORT': str(args.port)})
+    if args.model_name:
+        env['MODEL_NAME'] = args.model_name
+    base_url = f'http://127.0.0.1:{args.port}'
+    
+    master = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'api.api:app'], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_ready(base_url, args.timeout):
+            return {'workers': workers, 'error': 'server did not become ready'}
+        # Let the workers serve one request each before measuring memory
+        drive_load(base_url, workers, 1)
+        worker_memory = [memory_mb(pid) for pid in child_pids(master.pid)]
+        master_memory = memory_mb(master.pid)
+        completed, errors, elapsed = drive_load(base_url, args.clients, args.duration)
+    finally:
+        master.terminate()
+        master.wait()
+    
+    return {
+        'workers': workers,
+        'master_rss_mb': master_memory['rss'],
+        'worker_rss_mb': round(sum(m['rss'] for m in worker_memory) / len(worker_memory), 1),
+        'worker_pss_mb': round(sum(m['pss'] for m in worker_memory) / len(worker_memory), 1),
+        'worker_shared_mb': round(sum(m['shared'] for m in worker_memory) / len(worker_memory), 1),
+        'worker_private_mb': round(sum(m['private'] for m in worker_memory) / len(worker_memory), 1),
+        'total_pss_mb': round(sum(m['pss'] for m in worker_memory), 1),
+        'requests': completed,
+        'errors': errors,
+        'requests_per_second': round(completed / elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--port', type=int, default=5056)
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--model-name', default=None, help='overrides MODEL_NAME')
+    parser.add_argument('--output', default=None, help='optional path for the JSON report')
+    args = parser.parse_args()
+    
+    results = [run(workers, args) for workers in args.workers]
+    
+    print(f"{'workers':>7s} {'RSS/wkr':>9s} {'PSS/wkr':>9s} {'shared':>9s} {'private':>9s} {'req/s':>8s} {'errors':>7s}")
+    for result in results:
+        if 'error' in result:
+            print(f"{result['workers']:7d} {result['error']}")
+            continue
+        print(f"{result['workers']:7d} {result['worker_rss_mb']:9.1f} {result['worker_pss_mb']:9.1f} "
+              f"{result['worker_shared_mb']:9.1f} {result['worker_private_mb']:9.1f} "
+              f"{result['requests_per_second']:8.2f} {result['errors']:7d}")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
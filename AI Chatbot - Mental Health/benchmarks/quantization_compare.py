@@ -0,0 +1,157 @@
+"""Compare fp32 and int8 CPU inference: throughput, latency, memory and output divergence.
+
+Each mode runs in its own subprocess so resident memory is measured in
+isolation. Both use greedy decoding on the same fixed prompts, so any
+difference in the generated tokens comes from quantization. Run from the
+project root:
+    python -m benchmarks.quantization_compare --max-new-tokens 40 --repeats 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.stats import percentile
+
+DEFAULT_PROMPTS = [
+    "I've been feeling really anxious lately",
+    "I feel so lonely even when I'm around people",
+    "I'm having trouble sleeping and I can't stop worrying",
+    "I feel like I'm not good enough at anything",
+    "I had a panic attack yesterday and I'm scared it will happen again",
+    "Work has been overwhelming and I don't know how to cope",
+    "Hello, how are you today?",
+    "I just feel tired all the time",
+]
+
+
+def resident_memory_mb():
+    """Current resident set size of this process in MB (Linux /proc, falls back to peak RSS)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(args):
+    """Worker: load one mode, generate greedily for every prompt and print a JSON report"""
+    import torch
+    from model.chatbot_model import MentalHealthChatbot
+    
+    torch.manual_seed(args.seed)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    
+    chatbot = MentalHealthChatbot(model_name=args.model_name, quantize=args.mode if args.mode != 'fp32' else None)
+    tokenizer, model = chatbot.tokenizer, chatbot.model
+    memory_mb = resident_memory_mb()
+    
+    outputs = []
+    latencies = []
+    generated_tokens = 0
+    for repeat in range(args.repeats):
+        for prompt in args.prompts:
+            input_ids = tokenizer.encode(prompt + tokenizer.eos_token, return_tensors='pt')
+            started = time.perf_counter()
+            with torch.no_grad():
+                output = model.generate(
+                    input_ids,
+                    attention_mask=torch.ones(input_ids.shape, dtype=torch.long),
+                    max_new_tokens=args.max_new_tokens,
+                    do_sample=False,
+                    pad_token_id=tokenizer.eos_token_id
+                )
+            latencies.append(time.perf_counter() - started)
+            new_tokens = output[0][input_ids.shape[1]:].tolist()
+            generated_tokens += len(new_tokens)
+            if repeat == 0:
+                outputs.append(new_tokens)
+    
+    print(json.dumps({
+        'mode': args.mode,
+        'load_seconds': chatbot.load_seconds,
+        'resident_memory_mb': round(memory_mb, 1),
+        'peak_memory_mb': round(resident_memory_mb(), 1),
+        'tokens_per_second': round(generated_tokens / sum(latencies), 2),
+        'p50_latency_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_latency_ms': round(percentile(latencies, 95) * 1000, 1),
+        'outputs': outputs,
+    }))
+
+
+def token_agreement(reference, candidate):
+    """Fraction of positions (over the longer output) where both generated the same token"""
+    length = max(len(reference), len(candidate))
+    if length == 0:
+        return 1.0
+    return sum(1 for a, b in zip(reference, candidate) if a == b) / length
+
+
+def common_prefix(reference, candidate):
+    count = 0
+    for a, b in zip(reference, candidate):
+        if a != b:
+            break
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model-name', default=os.environ.get('MODEL_NAME', 'microsoft/DialoGPT-medium'))
+    parser.add_argument('--max-new-tokens', type=int, default=40)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=0, help='torch intra-op threads (0 keeps the default)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='optional path for the JSON report')
+    parser.add_argument('--mode', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.prompts = DEFAULT_PROMPTS
+    
+    if args.mode:
+        run_mode(args)
+        return
+    
+    reports = {}
+    for mode in ('fp32', 'int8'):
+        command = [sys.executable, '-m', 'benchmarks.quantization_compare', '--mode', mode,
+                   '--model-name', args.model_name, '--max-new-tokens', str(args.max_new_tokens),
+                   '--repeats', str(args.repeats), '--threads', str(args.threads), '--seed', str(args.seed)]
+        result = subprocess.run(command, capture_output=True, text=True, check=True)
+        reports[mode] = json.loads(result.stdout.strip().splitlines()[-1])
+    
+    reference, candidate = reports['fp32']['outputs'], reports['int8']['outputs']
+    agreement = [token_agreement(r, c) for r, c in zip(reference, candidate)]
+    divergence = {
+        'mean_token_agreement': round(sum(agreement) / len(agreement), 3),
+        'identical_outputs': sum(1 for r, c in zip(reference, candidate) if r == c),
+        'mean_common_prefix_tokens': round(
+            sum(common_prefix(r, c) for r, c in zip(reference, candidate)) / len(reference), 1
+        ),
+        'prompts': len(reference),
+    }
+    
+    print(f"{'mode':6s} {'tok/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'RSS MB':>8s}")
+    for mode, report in reports.items():
+        print(f"{mode:6s} {report['tokens_per_second']:8.1f} {report['p50_latency_ms']:9.1f} "
+              f"{report['p95_latency_ms']:9.1f} {report['resident_memory_mb']:8.1f}")
+    print(f"int8 vs fp32: {divergence['mean_token_agreement']:.1%} greedy token agreement, "
+          f"{divergence['identical_outputs']}/{divergence['prompts']} identical outputs, "
+          f"{divergence['mean_common_prefix_tokens']} tokens before first divergence on average")
+    
+    if args.output:
+        for report in reports.values():
+            report.pop('outputs')
+        with open(args.output, 'w') as f:
+            json.dump({'modes': reports, 'divergence': divergence}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Microbenchmark: enhance_response throughput, data-driven ResponseGenerator vs the original implementation.
+
+Run from the project root:
+    python -m benchmarks.response_generator_bench --messages 100000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.content_filter_bench import load_messages
+from utils.response_generator import DEFAULT_TEMPLATES, ResponseGenerator
+
+
+class LegacyResponseGenerator:
+    """The original checks: trigger and default lists rebuilt and scanned one by one on every call"""
+    
+    def __init__(self):
+        self.supportive_phrases = DEFAULT_TEMPLATES['supportive_phrases']
+        self.questions = DEFAULT_TEMPLATES['follow_up_questions']
+    
+    def enhance_response(self, generated_response, user_input):
+        if not generated_response or len(generated_response.strip()) < 5:
+            return self.get_default_response()
+        if self._needs_empathy(user_input):
+            generated_response = f"{random.choice(self.supportive_phrases)} {generated_response}"
+        if random.random() < 0.3:
+            generated_response += f" {random.choice(self.questions)}"
+        return generated_response
+    
+    def _needs_empathy(self, user_input):
+        empathy_triggers = [
+            "sad", "depressed", "anxious", "worried", "scared",
+            "lonely", "hopeless", "tired", "overwhelmed", "stressed"
+        ]
+        return any(trigger in user_input.lower() for trigger in empathy_triggers)
+    
+    def get_default_response(self):
+        defaults = [
+            "I'm here to listen. How are you feeling right now?",
+            "Thank you for reaching out. What's on your mind today?",
+            "I want to support you. Can you tell me more about what you're experiencing?",
+            "It's okay to take your time. I'm here when you're ready to share."
+        ]
+        return random.choice(defaults)
+
+
+def timed(generator, pairs):
+    started = time.perf_counter()
+    for reply, message in pairs:
+        generator.enhance_response(reply, message)
+    return time.perf_counter() - started
+
+
+def timed_triggers(generator, messages):
+    started = time.perf_counter()
+    for message in messages:
+        generator._needs_empathy(message)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    messages = load_messages(args.messages, args.seed)
+    rng = random.Random(args.seed)
+    # Mostly full generated replies, with some too short to use so the default path is exercised too
+    replies = ["That sounds hard, tell me more about it.", "It will be okay.", "ok", ""]
+    pairs = [(rng.choices(replies, weights=(6, 3, 1, 1))[0], message) for message in messages]
+    current = ResponseGenerator()
+    legacy = LegacyResponseGenerator()
+    
+    # Both classify the same messages as needing empathy
+    mismatches = sum(legacy._needs_empathy(m) != current._needs_empathy(m) for m in set(messages))
+    
+    results = {
+        'enhance_response legacy': timed(legacy, pairs),
+        'enhance_response data-driven': timed(current, pairs),
+        'triggers legacy': timed_triggers(legacy, messages),
+        'triggers data-driven': timed_triggers(current, messages),
+    }
+    print(f"{len(pairs)} calls, {mismatches} trigger mismatches")
+    for name, seconds in results.items():
+        baseline = results[name.split()[0] + ' legacy']
+        print(f"{name:30s} {seconds * 1000:9.1f} ms  {len(pairs) / seconds:12.0f} calls/s  "
+              f"{baseline / seconds:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Startup benchmark: time until the API answers /healthz and until /readyz reports ready.
+
+Starts `api/api.py` in a subprocess for each mode (lazy background loading and
+eager loading) and polls the health endpoints. Run from the project root:
+    python -m benchmarks.startup_bench --runs 3
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def wait_for(url, started, timeout):
+    """Seconds from `started` until url returns HTTP 200, or None on timeout"""
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.05)
+    return None
+
+
+def measure(lazy, port, timeout, model_name):
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'MODEL_LAZY': '1' if lazy else '0',
+        'PYTHONPATH': os.getcwd() + os.pathsep + env.get('PYTHONPATH', ''),
+    })
+    if model_name:
+        env['MODEL_NAME'] = model_name
+    
+    started = time.perf_counter()
+    # Run without the Flask reloader so only one process loads the model
+    process = subprocess.Popen(
+        [sys.executable, '-c', 'from api.api import app; import os; '
+                               'app.run(host="127.0.0.1", port=int(os.environ["PORT"]), debug=False)'],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        live = wait_for(f'http://127.0.0.1:{port}/healthz', started, timeout)
+        ready = wait_for(f'http://127.0.0.1:{port}/readyz', started, timeout)
+    finally:
+        process.terminate()
+        process.wait()
+    return live, ready
+
+
+def summarize(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return 'timeout'
+    return f"median {statistics.median(values):6.2f}s  min {min(values):6.2f}s  max {max(values):6.2f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--model-name', default=None, help='overrides MODEL_NAME')
+    args = parser.parse_args()
+    
+    for lazy in (True, False):
+        results = [measure(lazy, args.port, args.timeout, args.model_name) for _ in range(args.runs)]
+        mode = 'lazy ' if lazy else 'eager'
+        print(f"{mode} time to live:  {summarize([live for live, _ in results])}")
+        print(f"{mode} time to ready: {summarize([ready for _, ready in results])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+"""Statistics helpers shared by the benchmarks"""
+import math
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
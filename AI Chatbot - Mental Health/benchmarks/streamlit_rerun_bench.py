@@ -0,0 +1,103 @@
+"""Streamlit client rerun time against conversation length, windowed history vs the original per-message rendering.
+
+Each conversation length is preloaded into a fresh app.py session with
+streamlit.testing's AppTest, which runs the script in-process without a
+browser, and reruns are timed without sending a message, so no API is needed.
+The baseline is app.py with its history block swapped back to the original
+loop issuing one st.markdown per message; "joined" draws every message with
+the current single-element renderer. The measured time covers the script and
+building its page elements, not the browser's rendering, which grows with the
+same element count. Run from the project root:
+    python -m benchmarks.streamlit_rerun_bench --lengths 10 100 1000 --reruns 5
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from benchmarks.stats import percentile
+
+# The original history rendering: one markdown element per message, every message on every rerun
+LEGACY_HISTORY = '''with chat_container:
+    for message in st.session_state.messages:
+        if message["role"] == "user":
+            st.markdown(f'<div class="user-message">{message["content"]}</div>', unsafe_allow_html=True)
+        else:
+            st.markdown(f'<div class="bot-message">{message["content"]}</div>', unsafe_allow_html=True)
+
+'''
+
+
+def conversation(length):
+    """Alternating user and bot messages of realistic length"""
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant",
+         "content": f"Message {i}: " + "I have been feeling a little overwhelmed at work lately. " * 2}
+        for i in range(length)
+    ]
+
+
+def legacy_script():
+    """app.py's source with the windowed history block replaced by the original per-message loop"""
+    with open('app.py', 'r', encoding='utf-8') as f:
+        source = f.read()
+    legacy, replaced = re.subn(r'(?ms)^with chat_container:\n.*?(?=^def stream_chat)', lambda _: LEGACY_HISTORY, source)
+    if replaced != 1:
+        raise SystemExit("Could not find the history block in app.py")
+    return legacy
+
+
+def rerun_seconds(length, window, reruns, script=None):
+    from streamlit.testing.v1 import AppTest
+    
+    if script is not None:
+        app = AppTest.from_string(script, default_timeout=60)
+    else:
+        # AppTest resolves relative paths against this file, not the working directory
+        app = AppTest.from_file(os.path.abspath('app.py'), default_timeout=60)
+    app.session_state.messages = conversation(length)
+    if window is not None:
+        app.session_state.visible_messages = window
+    app.run()
+    timings = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        timings.append(time.perf_counter() - started)
+    if app.exception:
+        raise SystemExit(f"app.py raised: {app.exception[0].message}")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lengths', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--reruns', type=int, default=5)
+    parser.add_argument('--output', default=None, help='optional path for the JSON report')
+    args = parser.parse_args()
+    
+    legacy = legacy_script()
+    report = []
+    print(f"{'messages':>8s} {'legacy p50 ms':>14s} {'joined p50 ms':>14s} {'windowed p50 ms':>16s} {'speedup':>8s}")
+    for length in args.lengths:
+        baseline = percentile(rerun_seconds(length, None, args.reruns, legacy), 50)
+        joined = percentile(rerun_seconds(length, max(length, 1), args.reruns), 50)
+        windowed = percentile(rerun_seconds(length, None, args.reruns), 50)
+        report.append({
+            'messages': length,
+            'legacy_p50_ms': round(baseline * 1000, 1),
+            'joined_p50_ms': round(joined * 1000, 1),
+            'windowed_p50_ms': round(windowed * 1000, 1),
+            'speedup': round(baseline / windowed, 2),
+        })
+        print(f"{length:8d} {report[-1]['legacy_p50_ms']:14.1f} {report[-1]['joined_p50_ms']:14.1f} "
+              f"{report[-1]['windowed_p50_ms']:16.1f} {report[-1]['speedup']:7.2f}x")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""Gunicorn settings for multi-worker serving with shared model weights.
+
+Run from the project root:
+    gunicorn -c gunicorn.conf.py api.api:app
+"""
+import gc
+import multiprocessing
+import os
+
+# Load the model once in the master before forking, so every worker shares the
+# weight pages copy-on-write instead of loading its own copy
+os.environ.setdefault('MODEL_LAZY', '0')
+# Sessions must be visible to whichever worker serves the next message
+os.environ.setdefault('SESSION_STORE', 'sqlite')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Request threads per worker feed that worker's batch scheduler
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+timeout = 120
+
+def when_ready(server):
+    if workers > 1 and os.environ.get('METRICS_ENABLED', '1') == '1':
+        # Every worker keeps its own metrics and a scrape reaches whichever worker accepts it
+        server.log.warning("/metrics is per worker and not aggregated, so it is only correct with one worker "
+                           "(WEB_CONCURRENCY=1); with %d workers each scrape reports a random worker", workers)
+
+def pre_fork(server, worker):
+    # Keep the garbage collector away from objects created while preloading, so
+    # collections in the workers don't write to (and un-share) those pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    from api.api import on_worker_start
+    
+    # Split the cores between workers instead of every worker using all of them
+    on_worker_start(threads=max(1, multiprocessing.cpu_count() // workers))
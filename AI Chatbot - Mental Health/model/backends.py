@@ -0,0 +1,46 @@
+from model.quantization import quantize_model
+
+
+class TorchBackend:
+    """transformers AutoModelForCausalLM running in PyTorch (the default)"""
+    name = 'torch'
+    # Features relying on transformers' own generate(): session key/value reuse and assisted decoding
+    supports_session_cache = True
+    supports_assisted_decoding = True
+    
+    def load(self, model_name, quantize=None):
+        from transformers import AutoModelForCausalLM
+        
+        model = AutoModelForCausalLM.from_pretrained(model_name)
+        model.eval()
+        return quantize_model(model, quantize)
+
+
+class OnnxBackend:
+    """A decoder exported with python -m model.onnx_model, run by ONNX Runtime"""
+    name = 'onnx'
+    supports_session_cache = False
+    supports_assisted_decoding = False
+    
+    def __init__(self):
+        from model.onnx_model import require
+        
+        # Fail when the backend is selected rather than later, when the model loads in the background
+        require('onnxruntime')
+    
+    def load(self, model_name, quantize=None):
+        from model.onnx_model import OnnxCausalLM
+        
+        if quantize:
+            print(f"Quantization '{quantize}' applies to the torch backend only; loading the ONNX model as exported")
+        return OnnxCausalLM(model_name)
+
+
+BACKENDS = {backend.name: backend for backend in (TorchBackend, OnnxBackend)}
+
+
+def get_backend(name):
+    """Backend instance for a MODEL_BACKEND name"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unsupported model backend: {name} (expected one of {tuple(BACKENDS)})")
+    return BACKENDS[name]()
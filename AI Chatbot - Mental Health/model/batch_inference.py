@@ -0,0 +1,212 @@
+"""Offline batch inference: run a JSONL file of prompts through MentalHealthChatbot.
+
+Each input line is {"message": ..., "history": [{"user": ..., "bot": ...}], "id": ...}
+(history and id optional; id defaults to the line number). Prompts are sorted by
+token length and generated in batches, and every finished batch is appended to
+the output right away, so rerunning an interrupted job skips the prompts already
+written. Batches are fixed by the input, shard and batch size, and each one is
+sampled under a seed derived from --seed and its position, so a rerun or a resumed
+run produces the same replies. Run from the project root:
+    python -m model.batch_inference --input prompts.jsonl --output replies.jsonl --batch-size 16
+    python -m model.batch_inference --input prompts.jsonl --output replies.jsonl --processes 4
+With --processes N, N worker processes each take every Nth prompt and write
+replies-00-of-04.jsonl and so on next to --output.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+
+def load_prompts(path, shard=0, num_shards=1):
+    """(id, message, history) for this shard's lines of a JSONL prompt file"""
+    prompts = []
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f):
+            if not line.strip() or line_number % num_shards != shard:
+                continue
+            record = json.loads(line)
+            prompts.append((str(record.get('id', line_number)), record['message'], record.get('history') or None))
+    return prompts
+
+
+def shard_path(output, shard, num_shards):
+    if num_shards == 1:
+        return output
+    root, ext = os.path.splitext(output)
+    return f"{root}-{shard:02d}-of-{num_shards:02d}{ext or '.jsonl'}"
+
+
+def completed_ids(path):
+    """Ids already written to an output file, dropping a last line cut off by an interruption"""
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            f.truncate(end)
+    done = set()
+    for line in data[:end].splitlines():
+        if line.strip():
+            done.add(json.loads(line)['id'])
+    return done
+
+
+def make_batches(chatbot, prompts, batch_size):
+    """Prompts sorted by encoded length (shortest first) and split into batches, so padding stays small.
+    
+    Each prompt is encoded once and comes back as (id, message, history, prompt ids) for generate_batch.
+    """
+    encoded = [prompt + (chatbot._encode_prompt(prompt[1], prompt[2]),) for prompt in prompts]
+    order = sorted(range(len(encoded)), key=lambda i: (len(encoded[i][3]), i))
+    ordered = [encoded[i] for i in order]
+    return [ordered[start:start + batch_size] for start in range(0, len(ordered), batch_size)]
+
+
+def run_shard(args, shard, num_shards):
+    """Generate one shard's replies and return its throughput report"""
+    import torch
+    from model.chatbot_model import MentalHealthChatbot
+    from utils.metrics import GENERATED_TOKENS
+    
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    # The response cache would make replies depend on what ran before, so it stays off
+    chatbot = MentalHealthChatbot(
+        model_name=args.model_name,
+        backend=args.backend,
+        quantize=args.quantize,
+        max_new_tokens=args.max_new_tokens,
+        max_context_tokens=args.max_context_tokens,
+        max_context_turns=args.max_context_turns
+    )
+    if chatbot.model is None:
+        raise SystemExit(f"Failed to load {args.model_name}: {chatbot.load_error}")
+    
+    output = shard_path(args.output, shard, num_shards)
+    prompts = load_prompts(args.input, shard, num_shards)
+    done = completed_ids(output)
+    batches = make_batches(chatbot, prompts, args.batch_size)
+    
+    generated = skipped = 0
+    tokens_before = GENERATED_TOKENS.labels().value
+    started = time.perf_counter()
+    with open(output, 'a') as f:
+        for index, batch in enumerate(batches):
+            todo = [prompt for prompt in batch if prompt[0] not in done]
+            skipped += len(batch) - len(todo)
+            if not todo:
+                continue
+            # A partly written batch is regenerated whole so its replies match an uninterrupted run
+            seed = args.seed * 1000003 + shard * 10007 + index
+            torch.manual_seed(seed)
+            random.seed(seed)
+            responses = chatbot.generate_batch([message for _, message, _, _ in batch],
+                                               [history for _, _, history, _ in batch],
+                                               prompt_ids=[ids for _, _, _, ids in batch])
+            for (prompt_id, message, _, _), response in zip(batch, responses):
+                if prompt_id not in done:
+                    f.write(json.dumps({'id': prompt_id, 'message': message, 'response': response}) + '\n')
+            f.flush()
+            generated += len(todo)
+            if args.progress:
+                print(f"[shard {shard}] batch {index + 1}/{len(batches)}: {generated + skipped}/{len(prompts)} prompts",
+                      file=sys.stderr)
+    elapsed = time.perf_counter() - started
+    tokens = GENERATED_TOKENS.labels().value - tokens_before
+    
+    return {
+        'shard': shard,
+        'output': output,
+        'prompts': len(prompts),
+        'generated': generated,
+        'skipped': skipped,
+        'batches': len(batches),
+        'seconds': round(elapsed, 2),
+        'prompts_per_second': round(generated / elapsed, 2) if elapsed else 0.0,
+        'generated_tokens': tokens,
+        'tokens_per_second': round(tokens / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def run_processes(args):
+    """Run --processes shards as worker processes and combine their reports"""
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.processes)
+    command = [sys.executable, '-m', 'model.batch_inference', '--num-shards', str(args.processes),
+               '--threads', str(threads)]
+    for name in ('input', 'output', 'model_name', 'backend', 'quantize', 'batch_size', 'max_new_tokens',
+                 'max_context_tokens', 'max_context_turns', 'seed'):
+        value = getattr(args, name)
+        if value is not None:
+            command += ['--' + name.replace('_', '-'), str(value)]
+    if args.progress:
+        command.append('--progress')
+    
+    started = time.perf_counter()
+    workers = [subprocess.Popen(command + ['--shard', str(shard)], stdout=subprocess.PIPE, text=True)
+               for shard in range(args.processes)]
+    shards = []
+    for worker in workers:
+        stdout, _ = worker.communicate()
+        if worker.returncode != 0:
+            raise SystemExit(f"A worker exited with status {worker.returncode}")
+        shards.append(json.loads(stdout.strip().splitlines()[-1]))
+    elapsed = time.perf_counter() - started
+    
+    generated = sum(shard['generated'] for shard in shards)
+    tokens = sum(shard['generated_tokens'] for shard in shards)
+    # Shards generate concurrently, so throughput is over the slowest one; wall time adds model loading
+    seconds = max(shard['seconds'] for shard in shards)
+    return {
+        'prompts': sum(shard['prompts'] for shard in shards),
+        'generated': generated,
+        'skipped': sum(shard['skipped'] for shard in shards),
+        'seconds': seconds,
+        'wall_seconds': round(elapsed, 2),
+        'prompts_per_second': round(generated / seconds, 2) if seconds else 0.0,
+        'generated_tokens': tokens,
+        'tokens_per_second': round(tokens / seconds, 2) if seconds else 0.0,
+        'shards': shards,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a JSONL file of prompts through the chatbot in batches')
+    parser.add_argument('--input', required=True, help='JSONL with a message (and optional history and id) per line')
+    parser.add_argument('--output', required=True, help='JSONL of replies, appended to and resumed from')
+    parser.add_argument('--model-name', default=os.environ.get('MODEL_NAME', 'microsoft/DialoGPT-medium'))
+    parser.add_argument('--backend', default=None, help='torch or onnx (default MODEL_BACKEND or torch)')
+    parser.add_argument('--quantize', default=None)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--max-new-tokens', type=int, default=100)
+    parser.add_argument('--max-context-tokens', type=int, default=768)
+    parser.add_argument('--max-context-turns', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=1, help='worker processes, each taking one shard')
+    parser.add_argument('--shard', type=int, default=0, help='run only this shard of --num-shards')
+    parser.add_argument('--num-shards', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=0, help='torch threads per process (0 keeps the default)')
+    parser.add_argument('--progress', action='store_true', help='report each batch on stderr')
+    parser.add_argument('--report', default=None, help='optional path for the JSON throughput report')
+    args = parser.parse_args()
+    
+    if args.processes > 1:
+        report = run_processes(args)
+    else:
+        report = run_shard(args, args.shard, args.num_shards)
+    
+    print(f"{report['generated']} replies generated ({report['skipped']} already done) in {report['seconds']:.1f}s: "
+          f"{report['prompts_per_second']:.2f} prompts/s, {report['tokens_per_second']:.1f} tokens/s",
+          file=sys.stderr)
+    print(json.dumps(report))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
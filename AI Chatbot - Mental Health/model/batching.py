@@ -0,0 +1,239 @@
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from utils.metrics import INFERENCE_SECONDS, QUEUE_WAIT_SECONDS
+
+
+class SchedulerBusy(Exception):
+    """The pending-request queue is full; retry_after estimates the seconds until there is room"""
+    
+    def __init__(self, retry_after):
+        super().__init__(f"Too many pending requests, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TimedFuture(Future):
+    """Future for a queued request, also reporting its queue wait and inference time in seconds"""
+    
+    def __init__(self):
+        super().__init__()
+        self.queue_seconds = None
+        self.inference_seconds = None
+
+
+class _PendingRequest:
+    __slots__ = ('user_input', 'conversation_history', 'session_id', 'deadline', 'session_turns', 'future',
+                 'enqueued_at')
+
+    def __init__(self, user_input, conversation_history, session_id=None, deadline=None, session_turns=None):
+        self.user_input = user_input
+        self.conversation_history = list(conversation_history) if conversation_history else None
+        self.session_id = session_id
+        self.deadline = deadline
+        self.session_turns = session_turns
+        self.future = TimedFuture()
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchScheduler:
+    """Collects concurrent chat requests and runs them as one batched generate call.
+
+    This is the only thread running generation for the chat API. At most max_queue
+    requests wait for it; submit() rejects further ones with SchedulerBusy so callers
+    can shed load immediately (0 leaves the queue unbounded). reserve() runs the same
+    check ahead of submit(), so callers can shed a request before doing any work for it.
+    """
+    
+    def __init__(self, chatbot, max_batch_size=8, max_wait_ms=20, stats_window=100, max_queue=64):
+        self.chatbot = chatbot
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.max_queue = max(0, int(max_queue))
+        self._queue = queue.Queue()
+        self._admit_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._recent_batches = deque(maxlen=stats_window)
+        self._total_batches = 0
+        self._total_requests = 0
+        self._rejected = 0
+        self._reserved = 0
+        self._worker = None
+        self._stopped = threading.Event()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+    
+    def _after_fork(self):
+        """Pre-fork servers: the worker thread doesn't survive fork, so start fresh in the child"""
+        self._queue = queue.Queue()
+        self._admit_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reserved = 0
+        self._stopped = threading.Event()
+        self._worker = None
+
+    def start(self):
+        """Start the background worker thread (idempotent)"""
+        if self._worker is None or not self._worker.is_alive():
+            self._stopped.clear()
+            self._worker = threading.Thread(target=self._run, name='batch-scheduler', daemon=True)
+            self._worker.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Stop the worker after it finishes the batch it is working on"""
+        self._stopped.set()
+        self._queue.put(None)
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def submit(self, user_input, conversation_history=None, session_id=None, deadline=None, reserved=False,
+               session_turns=None):
+        """Queue a request and return a TimedFuture resolving to the response text.
+        
+        Requests with a session_id use the chatbot's per-session KV cache and are
+        generated one at a time rather than batched; session_turns (exchanges the
+        session has had) anchors their history window. A deadline (a time.perf_counter()
+        value) bounds the request's time in the queue and in generation. Raises
+        SchedulerBusy when max_queue requests are already waiting, unless reserved
+        says the caller already holds a place from reserve().
+        """
+        self.start()
+        pending = _PendingRequest(user_input, conversation_history, session_id, deadline, session_turns)
+        with self._admit_lock:
+            if reserved:
+                self._reserved -= 1
+            else:
+                self._admit()
+            self._queue.put(pending)
+        return pending.future
+
+    def reserve(self):
+        """Hold a place in the queue for a later submit(reserved=True); raises SchedulerBusy when full"""
+        with self._admit_lock:
+            self._admit()
+            self._reserved += 1
+    
+    def release(self):
+        """Give back a place from reserve() that won't be submitted"""
+        with self._admit_lock:
+            self._reserved -= 1
+    
+    def _admit(self):
+        """Raise SchedulerBusy when queued and reserved requests fill max_queue (called holding _admit_lock)"""
+        if self.max_queue and self._queue.qsize() + self._reserved >= self.max_queue:
+            with self._stats_lock:
+                self._rejected += 1
+            raise SchedulerBusy(self.retry_after())
+    
+    def generate_response(self, user_input, conversation_history=None, timeout=None, session_id=None, deadline=None):
+        """Blocking drop-in replacement for MentalHealthChatbot.generate_response"""
+        return self.submit(user_input, conversation_history, session_id, deadline).result(timeout)
+    
+    def retry_after(self):
+        """Whole seconds until the current queue is likely drained, from recent batch times"""
+        with self._stats_lock:
+            recent = list(self._recent_batches)[-10:]
+        batch_seconds = sum(batch['inference_ms'] for batch in recent) / len(recent) / 1000 if recent else 1.0
+        batches = math.ceil((self._queue.qsize() + self._reserved) / self.max_batch_size)
+        return max(1, math.ceil(batches * batch_seconds))
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return []
+        if first.session_id is not None:
+            # Cached-session requests run on their own, so there is nothing to wait for
+            return [first]
+        batch = [first]
+        wait_until = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = wait_until - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            batched = [item for item in batch if item.session_id is None]
+            if batched:
+                self._generate(batched, lambda: self.chatbot.generate_batch(
+                    [item.user_input for item in batched],
+                    [item.conversation_history for item in batched],
+                    [item.deadline for item in batched]
+                ))
+            for item in batch:
+                if item.session_id is not None:
+                    self._generate([item], lambda: [self.chatbot.generate_response(
+                        item.user_input, item.conversation_history, session_id=item.session_id,
+                        deadline=item.deadline, session_turns=item.session_turns
+                    )])
+            finished = time.perf_counter()
+
+            self._record_batch(batch, started, finished)
+
+    def _generate(self, items, generate):
+        """Run one generate call for items and resolve their futures with the responses and timings"""
+        started = time.perf_counter()
+        try:
+            responses = generate()
+            error = None
+        except Exception as e:
+            responses, error = [], e
+        finished = time.perf_counter()
+        for item, response in zip(items, responses):
+            item.future.queue_seconds = started - item.enqueued_at
+            item.future.inference_seconds = finished - started
+            QUEUE_WAIT_SECONDS.observe(item.future.queue_seconds)
+            INFERENCE_SECONDS.observe(item.future.inference_seconds)
+            item.future.set_result(response)
+        for item in items:
+            if not item.future.done():
+                item.future.set_exception(error or RuntimeError('No response generated'))
+    
+    def _record_batch(self, batch, started, finished):
+        with self._stats_lock:
+            self._total_batches += 1
+            self._total_requests += len(batch)
+            self._recent_batches.append({
+                'size': len(batch),
+                'max_queue_wait_ms': round((started - batch[0].enqueued_at) * 1000, 2),
+                'inference_ms': round((finished - started) * 1000, 2),
+                'finished_at': time.time()
+            })
+
+    def stats(self):
+        """Get aggregate and recent per-batch statistics"""
+        with self._stats_lock:
+            recent = list(self._recent_batches)
+            total_batches = self._total_batches
+            total_requests = self._total_requests
+            rejected = self._rejected
+
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'max_queue': self.max_queue,
+            'queue_depth': self._queue.qsize(),
+            'reserved': self._reserved,
+            'rejected': rejected,
+            'total_batches': total_batches,
+            'total_requests': total_requests,
+            'avg_batch_size': round(total_requests / total_batches, 2) if total_batches else 0.0,
+            'recent_batches': recent
+        }
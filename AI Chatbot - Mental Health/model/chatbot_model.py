@@ -1,74 +1,614 @@
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, Trainer, TrainingArguments
 from utils.response_generator import ResponseGenerator
+from model.kv_cache import SessionKVCache, KVCacheEntry
+from model.backends import get_backend
+from model.quantization import quantize_model
+from model.response_cache import ResponseCandidateCache, normalize_message
+from utils.profiling import stage_timer
+from utils.metrics import ERRORS, record_deadline, record_generation
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
 
 class MentalHealthChatbot:
-    def __init__(self, model_name="microsoft/DialoGPT-medium"):
+    def __init__(self, model_name="microsoft/DialoGPT-medium", kv_cache_mb=0, max_context_tokens=768,
+                 lazy=False, quantize=None, response_cache_size=0, response_cache_ttl=3600,
+                 response_cache_pool=4, draft_model_name=None, max_new_tokens=100, max_context_turns=3,
+                 backend=None):
         self.model_name = model_name
+        # Inference backend ('torch' or 'onnx'), also settable via MODEL_BACKEND
+        self.backend = get_backend(backend or os.environ.get('MODEL_BACKEND') or 'torch')
+        # Weight quantization for CPU inference ('int8' or None), also settable via MODEL_QUANTIZE
+        self.quantize = quantize if quantize is not None else (os.environ.get('MODEL_QUANTIZE') or None)
+        # Smaller model of the same family that drafts tokens for the main model to verify
+        # (assisted decoding), also settable via DRAFT_MODEL_NAME
+        self.draft_model_name = (
+            draft_model_name if draft_model_name is not None else (os.environ.get('DRAFT_MODEL_NAME') or None)
+        )
         self.tokenizer = None
         self.model = None
+        self.draft_model = None
         self.response_generator = ResponseGenerator()
-        self.load_model()
+        # Prompt token budget: the newest turns that fit in max_context_tokens, leaving room
+        # within the model's position limit for a max_new_tokens reply
+        self.max_context_tokens = max_context_tokens
+        self.max_new_tokens = max_new_tokens
+        self.max_context_turns = max_context_turns
+        self.context_stats = {
+            'prompts': 0,
+            'truncated_inputs': 0,
+            'truncated_turns': 0,
+            'dropped_turns': 0,
+            'turn_cache_hits': 0,
+            'turn_cache_misses': 0
+        }
+        # Requests whose deadline passed before generation started, replies cut short by their
+        # deadline (to whole sentences or to a default response) and the generation time thrown away
+        self.deadline_stats = {
+            'expired_in_queue': 0,
+            'partial': 0,
+            'fallback': 0,
+            'wasted_seconds': 0.0
+        }
+        # Token ids of recently seen history exchanges, which recur in every later prompt of a session
+        self._turn_tokens = OrderedDict()
+        self._turn_tokens_max = 4096
+        self._turn_tokens_lock = threading.Lock()
+        # Per-session KV cache reuse is opt-in; 0 keeps the stateless behaviour
+        self.kv_cache = SessionKVCache(kv_cache_mb * 1024 * 1024) if kv_cache_mb > 0 else None
+        if self.kv_cache is not None and not self.backend.supports_session_cache:
+            print(f"The {self.backend.name} backend can't reuse session key/values; KV cache disabled")
+            self.kv_cache = None
+        # Pools of sampled replies for first-turn messages; 0 disables the cache
+        self.response_cache = (
+            ResponseCandidateCache(response_cache_size, response_cache_ttl, response_cache_pool)
+            if response_cache_size > 0 else None
+        )
+        
+        # Readiness: set once the model is loaded (and warmed up, when loading in the background)
+        self.ready = threading.Event()
+        self.load_error = None
+        self.load_seconds = None
+        self._loader = None
+        if not lazy:
+            self.load_model()
+            if self.model is not None:
+                self.ready.set()
     
     def load_model(self):
         """Load the pre-trained model and tokenizer"""
+        started = time.perf_counter()
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForCausalLM.from_pretrained(self.model_name)
+            # Imported here rather than at module level: importing transformers takes
+            # several seconds and would otherwise delay the server binding its port
+            from transformers import AutoTokenizer
+            
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            model = self.backend.load(self.model_name, self.quantize)
             
             # Add padding token if it doesn't exist
-            if self.tokenizer.pad_token is None:
-                self.tokenizer.pad_token = self.tokenizer.eos_token
-                
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            
+            # Publish the model last: requests check self.model to decide whether to use it
+            self.draft_model = self._load_draft_model(model)
+            self.tokenizer = tokenizer
+            self.model = model
+            self.load_seconds = time.perf_counter() - started
             print("Model loaded successfully!")
         except Exception as e:
+            self.load_error = str(e)
             print(f"Error loading model: {e}")
+            ERRORS.labels('model_load').inc()
     
-    def generate_response(self, user_input, conversation_history=None):
-        """Generate response for user input"""
+    def _load_draft_model(self, model):
+        """Load the draft model for assisted decoding, or None to fall back to plain decoding"""
+        if not self.draft_model_name:
+            return None
+        if not self.backend.supports_assisted_decoding:
+            print(f"The {self.backend.name} backend doesn't support assisted decoding; draft model not loaded")
+            return None
         try:
-            # Prepare input with conversation context
-            if conversation_history:
-                context = self._build_context(conversation_history[-3:])  # Last 3 exchanges
-                full_input = f"{context}{user_input}"
-            else:
-                full_input = user_input
+            from transformers import AutoModelForCausalLM
             
-            # Tokenize input
-            input_ids = self.tokenizer.encode(
-                full_input + self.tokenizer.eos_token,
-                return_tensors='pt'
-            )
+            draft_model = AutoModelForCausalLM.from_pretrained(self.draft_model_name)
+            # Drafted token ids are verified as-is, so both models must share a vocabulary
+            if draft_model.config.vocab_size != model.config.vocab_size:
+                print(f"Draft model {self.draft_model_name} has a different vocabulary; assisted decoding disabled")
+                return None
+            draft_model.eval()
+            print(f"Draft model {self.draft_model_name} loaded for assisted decoding")
+            return quantize_model(draft_model, self.quantize)
+        except Exception as e:
+            print(f"Error loading draft model, assisted decoding disabled: {e}")
+            ERRORS.labels('model_load').inc()
+            return None
+    
+    def load_async(self, warmup=True):
+        """Load the model on a background thread so the server can start serving immediately"""
+        if self._loader is None:
+            self._loader = threading.Thread(target=self._load_and_warm_up, args=(warmup,),
+                                            name='model-loader', daemon=True)
+            self._loader.start()
+        return self._loader
+    
+    def _load_and_warm_up(self, warmup):
+        self.load_model()
+        if self.model is None:
+            return
+        if warmup:
+            # One short generation so the first real request doesn't pay for lazy initialisation
+            try:
+                input_ids = self.tokenizer.encode("Hello" + self.tokenizer.eos_token, return_tensors='pt')
+                with torch.no_grad():
+                    self.model.generate(
+                        input_ids,
+                        max_length=input_ids.shape[1] + 8,
+                        pad_token_id=self.tokenizer.eos_token_id,
+                        attention_mask=torch.ones(input_ids.shape, dtype=torch.long)
+                    )
+            except Exception as e:
+                print(f"Error warming up model: {e}")
+        self.ready.set()
+    
+    @property
+    def is_ready(self):
+        return self.ready.is_set()
+    
+    def status(self):
+        """Loading state for health checks"""
+        if self.ready.is_set():
+            state = 'ready'
+        elif self.load_error is not None:
+            state = 'failed'
+        elif self.model is not None:
+            state = 'warming_up'
+        else:
+            state = 'loading'
+        return {
+            'state': state,
+            'model_name': self.model_name,
+            'backend': self.backend.name,
+            'quantize': self.quantize,
+            'draft_model': self.draft_model_name if self.draft_model is not None else None,
+            'load_seconds': round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            'error': self.load_error
+        }
+    
+    def generate_response(self, user_input, conversation_history=None, session_id=None, deadline=None,
+                          session_turns=None):
+        """Generate response for user input, stopping generation at deadline (a time.perf_counter() value).
+        
+        session_turns, the number of exchanges the session has had, anchors the
+        history window of KV-cached sessions.
+        """
+        if self.model is None:
+            # Still loading: answer with a supportive default rather than blocking
+            return self.response_generator.get_default_response()
+        
+        cache_key = self._response_cache_key(user_input, conversation_history)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return self._enhance(cached, user_input)
+        
+        if self._expired(deadline):
+            return self.response_generator.get_default_response()
+        
+        if self.kv_cache is not None and session_id is not None:
+            return self._generate_with_kv_cache(user_input, conversation_history, session_id, cache_key, deadline,
+                                                session_turns)
+        
+        try:
+            # Tokenize input with conversation context
+            with stage_timer.stage('tokenize'):
+                input_ids = torch.tensor([self._encode_prompt(user_input, conversation_history)])
             
             # Generate response
-            with torch.no_grad():
+            criteria = self._deadline_criteria([deadline], input_ids.shape[1])
+            generate_started = time.perf_counter()
+            with stage_timer.stage('generate'), torch.no_grad():
                 output = self.model.generate(
                     input_ids,
-                    max_length=input_ids.shape[1] + 100,
+                    max_new_tokens=self.max_new_tokens,
                     num_return_sequences=1,
                     temperature=0.7,
                     do_sample=True,
                     pad_token_id=self.tokenizer.eos_token_id,
-                    attention_mask=torch.ones(input_ids.shape, dtype=torch.long)
+                    attention_mask=torch.ones(input_ids.shape, dtype=torch.long),
+                    **self._assisted_kwargs(),
+                    **(criteria.as_kwargs() if criteria is not None else {})
                 )
             
+            self._record_generation(input_ids.shape[1], output[:, input_ids.shape[1]:], generate_started)
+            
             # Decode response
-            response = self.tokenizer.decode(
-                output[0][input_ids.shape[1]:],
-                skip_special_tokens=True
-            ).strip()
+            with stage_timer.stage('decode'):
+                response = self.tokenizer.decode(
+                    output[0][input_ids.shape[1]:],
+                    skip_special_tokens=True
+                ).strip()
+            if criteria is not None and criteria.hit[0]:
+                response = self._deadline_reply(response, criteria.stopped_after[0])
+            else:
+                self._cache_candidate(cache_key, response)
             
             # Post-process response for mental health context
-            response = self.response_generator.enhance_response(response, user_input)
+            response = self._enhance(response, user_input)
             
             return response if response else self.response_generator.get_default_response()
-            
+        
         except Exception as e:
             print(f"Error generating response: {e}")
+            ERRORS.labels('generate').inc()
             return self.response_generator.get_default_response()
     
+    def stream_response(self, user_input, conversation_history=None, deadline=None):
+        """Generate a response incrementally.
+        
+        Yields ('token', text) events while the model decodes, then a single
+        ('response', text) event carrying the enhanced final response. Decoding
+        stops at deadline, and the final response keeps only complete sentences.
+        """
+        if self.model is None or self._expired(deadline):
+            yield 'response', self.response_generator.get_default_response()
+            return
+        
+        chunks = []
+        try:
+            from transformers import TextIteratorStreamer
+            
+            with stage_timer.stage('tokenize'):
+                input_ids = torch.tensor([self._encode_prompt(user_input, conversation_history)])
+            streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+            criteria = self._deadline_criteria([deadline], input_ids.shape[1])
+            generation_errors = []
+            
+            def run_generate():
+                try:
+                    generate_started = time.perf_counter()
+                    with stage_timer.stage('generate'), torch.no_grad():
+                        output = self.model.generate(
+                            input_ids,
+                            max_new_tokens=self.max_new_tokens,
+                            num_return_sequences=1,
+                            temperature=0.7,
+                            do_sample=True,
+                            pad_token_id=self.tokenizer.eos_token_id,
+                            attention_mask=torch.ones(input_ids.shape, dtype=torch.long),
+                            streamer=streamer,
+                            **self._assisted_kwargs(),
+                            **(criteria.as_kwargs() if criteria is not None else {})
+                        )
+                    self._record_generation(input_ids.shape[1], output[:, input_ids.shape[1]:], generate_started)
+                except Exception as e:
+                    generation_errors.append(e)
+                    streamer.end()
+            
+            thread = threading.Thread(target=run_generate, daemon=True)
+            thread.start()
+            for text in streamer:
+                if text:
+                    chunks.append(text)
+                    yield 'token', text
+            thread.join()
+            if generation_errors:
+                raise generation_errors[0]
+            
+            response = ''.join(chunks).strip()
+            if criteria is not None and criteria.hit[0]:
+                response = self._deadline_reply(response, criteria.stopped_after[0])
+            response = self._enhance(response, user_input)
+            yield 'response', response if response else self.response_generator.get_default_response()
+        
+        except Exception as e:
+            print(f"Error streaming response: {e}")
+            ERRORS.labels('generate').inc()
+            yield 'response', self.response_generator.get_default_response()
+    
+    def generate_batch(self, user_inputs, conversation_histories=None, deadlines=None, prompt_ids=None):
+        """Generate responses for several user inputs in one model.generate call.
+        
+        Each input can have its own deadline; rows are stopped independently.
+        prompt_ids reuses prompts already built by _encode_prompt.
+        """
+        if self.model is None:
+            return [self.response_generator.get_default_response() for _ in user_inputs]
+        
+        if conversation_histories is None:
+            conversation_histories = [None] * len(user_inputs)
+        if deadlines is None:
+            deadlines = [None] * len(user_inputs)
+        
+        responses = [None] * len(user_inputs)
+        cache_keys = [None] * len(user_inputs)
+        pending = []
+        for i, (user_input, history) in enumerate(zip(user_inputs, conversation_histories)):
+            cache_keys[i] = self._response_cache_key(user_input, history)
+            cached = self.response_cache.get(cache_keys[i]) if cache_keys[i] is not None else None
+            if cached is not None:
+                responses[i] = self._enhance(cached, user_input)
+            elif self._expired(deadlines[i]):
+                responses[i] = self.response_generator.get_default_response()
+            else:
+                pending.append(i)
+        if not pending:
+            return responses
+        
+        try:
+            with stage_timer.stage('tokenize'):
+                input_ids, attention_mask = self._left_pad([
+                    prompt_ids[i] if prompt_ids is not None
+                    else self._encode_prompt(user_inputs[i], conversation_histories[i])
+                    for i in pending
+                ])
+            input_length = input_ids.shape[1]
+            criteria = self._deadline_criteria([deadlines[i] for i in pending], input_length)
+            
+            generate_started = time.perf_counter()
+            with stage_timer.stage('generate'), torch.no_grad():
+                output = self.model.generate(
+                    input_ids,
+                    attention_mask=attention_mask,
+                    max_new_tokens=self.max_new_tokens,
+                    num_return_sequences=1,
+                    temperature=0.7,
+                    do_sample=True,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    **self._assisted_kwargs(len(pending)),
+                    **(criteria.as_kwargs() if criteria is not None else {})
+                )
+            
+            self._record_generation(
+                int(attention_mask.sum()), output[:, input_length:], generate_started
+            )
+            
+            for row, (i, sequence) in enumerate(zip(pending, output)):
+                with stage_timer.stage('decode'):
+                    response = self.tokenizer.decode(
+                        sequence[input_length:],
+                        skip_special_tokens=True
+                    ).strip()
+                if criteria is not None and criteria.hit[row]:
+                    response = self._deadline_reply(response, criteria.stopped_after[row])
+                else:
+                    self._cache_candidate(cache_keys[i], response)
+                response = self._enhance(response, user_inputs[i])
+                responses[i] = response if response else self.response_generator.get_default_response()
+            return responses
+        
+        except Exception as e:
+            print(f"Error generating batch responses: {e}")
+            ERRORS.labels('generate').inc()
+            return [
+                response if response is not None else self.response_generator.get_default_response()
+                for response in responses
+            ]
+    
+    def _generate_with_kv_cache(self, user_input, conversation_history, session_id, cache_key=None, deadline=None,
+                                session_turns=None):
+        """Generate a response reusing the session's cached history key/values so only new tokens are encoded.
+        
+        The cache holds the history part of the previous prompt in the same format as a fresh
+        prompt, so a hit feeds the model exactly what a recompute would. Rather than sliding by
+        one exchange a turn, the history window grows within blocks of max_context_turns
+        exchanges counted from session_turns (1, 2, 3, then 1 again for a block of 3), so the
+        cached history stays the start of the next prompt until the block fills. It recomputes
+        at the start of a block, after eviction, or when the prompt would be truncated.
+        """
+        history = conversation_history[-self.max_context_turns:] if conversation_history else []
+        if history and session_turns:
+            history = history[-((session_turns - 1) % self.max_context_turns + 1):]
+        # Taking the entry out means a failed generation can never leave a half-extended cache behind
+        entry = self.kv_cache.get(session_id)
+        try:
+            with stage_timer.stage('tokenize'):
+                user_ids = self.tokenizer.encode(user_input + self.tokenizer.eos_token)
+                turns = [self._build_context([exchange]) for exchange in history]
+                turn_ids = [self._encode_turn(exchange) for exchange in history]
+            history_length = sum(len(ids) for ids in turn_ids)
+            fits = history_length + len(user_ids) <= self._prompt_budget()
+            
+            if (entry is not None and fits and entry.turns and
+                    tuple(turns[:len(entry.turns)]) == entry.turns):
+                cached_length = entry.token_ids.shape[1]
+                new_ids = [token for ids in turn_ids[len(entry.turns):] for token in ids] + user_ids
+                input_ids = torch.cat([entry.token_ids, torch.tensor([new_ids])], dim=1)
+                past_key_values = entry.past_key_values
+                self.kv_cache.record_hit()
+                self.context_stats['prompts'] += 1
+            else:
+                # Evicted, a new block started or the prompt must be truncated
+                self.kv_cache.recomputes += 1
+                cached_length = 0
+                with stage_timer.stage('tokenize'):
+                    input_ids = torch.tensor([self._encode_prompt(user_input, history, user_ids)])
+                past_key_values = None
+            
+            criteria = self._deadline_criteria([deadline], input_ids.shape[1])
+            generate_started = time.perf_counter()
+            with stage_timer.stage('generate'), torch.no_grad():
+                output = self.model.generate(
+                    input_ids,
+                    past_key_values=past_key_values,
+                    max_new_tokens=self.max_new_tokens,
+                    num_return_sequences=1,
+                    temperature=0.7,
+                    do_sample=True,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    attention_mask=torch.ones(input_ids.shape, dtype=torch.long),
+                    return_dict_in_generate=True,
+                    use_cache=True,
+                    **self._assisted_kwargs(),
+                    **(criteria.as_kwargs() if criteria is not None else {})
+                )
+            
+            # Only the tokens past the cached history are encoded when the cache was reused
+            self._record_generation(
+                input_ids.shape[1] - cached_length, output.sequences[:, input_ids.shape[1]:], generate_started
+            )
+            
+            with stage_timer.stage('decode'):
+                response = self.tokenizer.decode(
+                    output.sequences[0][input_ids.shape[1]:],
+                    skip_special_tokens=True
+                ).strip()
+            if criteria is not None and criteria.hit[0]:
+                response = self._deadline_reply(response, criteria.stopped_after[0])
+            else:
+                self._cache_candidate(cache_key, response)
+            response = self._enhance(response, user_input)
+            response = response if response else self.response_generator.get_default_response()
+            
+            # Keep the key/values of this prompt's history, which the next prompt starts with
+            # unless this one filled the block; an untruncated prompt begins with exactly those tokens
+            if fits and history_length and len(history) < self.max_context_turns:
+                past = output.past_key_values
+                for layer in past.layers:
+                    # Copies rather than views, so the entry doesn't pin the reply's key/values too
+                    layer.keys = layer.keys[..., :history_length, :].clone()
+                    layer.values = layer.values[..., :history_length, :].clone()
+                self.kv_cache.put(session_id, KVCacheEntry(turns, input_ids[:, :history_length], past))
+            return response
+        
+        except Exception as e:
+            print(f"Error generating cached response: {e}")
+            ERRORS.labels('generate').inc()
+            return self.response_generator.get_default_response()
+    
+    def _assisted_kwargs(self, batch_size=1):
+        """Extra generate() arguments enabling assisted decoding, which only supports single sequences"""
+        if self.draft_model is None or batch_size != 1:
+            return {}
+        return {'assistant_model': self.draft_model}
+    
+    def _deadline_criteria(self, deadlines, prompt_length):
+        """Stopping criterion for rows with a deadline, or None when no row has one"""
+        if all(deadline is None for deadline in deadlines):
+            return None
+        from model.deadlines import DeadlineCriteria
+        
+        return DeadlineCriteria(deadlines, prompt_length, self.tokenizer.eos_token_id)
+    
+    def _expired(self, deadline):
+        """Whether a request's deadline passed before its generation could start"""
+        if deadline is None or time.perf_counter() < deadline:
+            return False
+        self.deadline_stats['expired_in_queue'] += 1
+        record_deadline('expired_in_queue')
+        return True
+    
+    def _deadline_reply(self, raw_response, seconds):
+        """Raw reply for a generation its deadline cut short: its complete sentences, or '' to fall back"""
+        from model.deadlines import cut_at_sentence
+        
+        partial = cut_at_sentence(raw_response)
+        # Generation time spent on text that is thrown away, estimated from the share of characters dropped
+        wasted = seconds * (1 - len(partial) / len(raw_response)) if raw_response else seconds
+        outcome = 'partial' if partial else 'fallback'
+        self.deadline_stats[outcome] += 1
+        self.deadline_stats['wasted_seconds'] += wasted
+        record_deadline(outcome, wasted)
+        return partial
+    
+    def _record_generation(self, prompt_tokens, generated_ids, started):
+        """Report prompt and generated token counts (padding and EOS excluded) for metrics"""
+        seconds = time.perf_counter() - started
+        generated_tokens = int((generated_ids != self.tokenizer.eos_token_id).sum())
+        record_generation(prompt_tokens, generated_tokens, seconds)
+    
+    def _enhance(self, response, user_input):
+        """Post-process a raw model reply for the mental health context"""
+        with stage_timer.stage('enhance_response'):
+            return self.response_generator.enhance_response(response, user_input)
+    
+    def _response_cache_key(self, user_input, conversation_history):
+        """Cache key for a first-turn message, or None when the response cache doesn't apply"""
+        if self.response_cache is None or conversation_history:
+            return None
+        return normalize_message(user_input) or None
+    
+    def _cache_candidate(self, cache_key, raw_response):
+        """Pool a raw (un-enhanced) model reply so later identical openers can reuse it"""
+        if cache_key is not None and raw_response:
+            self.response_cache.add(cache_key, raw_response)
+    
+    def _prompt_budget(self):
+        """Most prompt tokens allowed: max_context_tokens, less if the reply would overrun the model's positions"""
+        config = self.model.config
+        positions = getattr(config, 'n_positions', None) or getattr(config, 'max_position_embeddings', None) or 1024
+        return max(1, min(self.max_context_tokens, positions - self.max_new_tokens))
+    
+    def _encode_turn(self, exchange):
+        """Token ids of one history exchange, cached since it recurs in every later prompt of the session"""
+        text = self._build_context([exchange])
+        with self._turn_tokens_lock:
+            ids = self._turn_tokens.get(text)
+            if ids is not None:
+                self._turn_tokens.move_to_end(text)
+                self.context_stats['turn_cache_hits'] += 1
+                return ids
+            self.context_stats['turn_cache_misses'] += 1
+        # Each exchange ends with a newline, which BPE never merges with the following
+        # text, so encoding turns separately gives the same ids as encoding the joined prompt
+        ids = self.tokenizer.encode(text)
+        with self._turn_tokens_lock:
+            self._turn_tokens[text] = ids
+            if len(self._turn_tokens) > self._turn_tokens_max:
+                self._turn_tokens.popitem(last=False)
+        return ids
+    
+    def _encode_prompt(self, user_input, conversation_history=None, user_ids=None):
+        """Token ids of the prompt: as many of the newest exchanges as fit the budget, then the user input.
+        
+        An over-long user input keeps its end; the oldest exchange that only partly fits is
+        cut from the front, and anything older is dropped. user_ids reuses an already
+        encoded user_input + EOS.
+        """
+        if user_ids is None:
+            user_ids = self.tokenizer.encode(user_input + self.tokenizer.eos_token)
+        budget = self._prompt_budget()
+        stats = self.context_stats
+        stats['prompts'] += 1
+        if len(user_ids) >= budget:
+            if len(user_ids) > budget:
+                stats['truncated_inputs'] += 1
+            stats['dropped_turns'] += len(conversation_history[-self.max_context_turns:]) if conversation_history else 0
+            return list(user_ids[-budget:])
+        
+        room = budget - len(user_ids)
+        turns = []
+        history = conversation_history[-self.max_context_turns:] if conversation_history else []
+        for index in range(len(history) - 1, -1, -1):
+            if room == 0:
+                stats['dropped_turns'] += index + 1
+                break
+            ids = self._encode_turn(history[index])
+            if len(ids) > room:
+                ids = ids[-room:]
+                stats['truncated_turns'] += 1
+            turns.append(ids)
+            room -= len(ids)
+        
+        prompt = []
+        for ids in reversed(turns):
+            prompt.extend(ids)
+        prompt.extend(user_ids)
+        return prompt
+    
+    def _left_pad(self, sequences):
+        """Left-pad token id lists into input_ids and attention_mask so every prompt ends where generation starts"""
+        length = max(len(ids) for ids in sequences)
+        input_ids = torch.full((len(sequences), length), self.tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(sequences), length), dtype=torch.long)
+        for row, ids in enumerate(sequences):
+            if ids:
+                input_ids[row, -len(ids):] = torch.tensor(ids, dtype=torch.long)
+                attention_mask[row, -len(ids):] = 1
+        return input_ids, attention_mask
+    
     def _build_context(self, history):
         """Build conversation context from history"""
         context = ""
@@ -0,0 +1,48 @@
+import re
+import time
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+# End of a sentence: terminal punctuation, optional closing quotes or brackets, then whitespace or the end
+_SENTENCE_END = re.compile(r'[.!?]+["\')\]]*(?=\s|$)')
+
+
+class DeadlineCriteria(StoppingCriteria):
+    """Stops each sequence of a generate() call once its deadline (a time.perf_counter() value) passes.
+    
+    Rows without a deadline run to completion. hit[row] records the rows that were
+    still generating when stopped, and stopped_after[row] how long they had run.
+    """
+    
+    def __init__(self, deadlines, prompt_length, eos_token_id):
+        self.deadlines = list(deadlines)
+        self.prompt_length = prompt_length
+        self.eos_token_id = eos_token_id
+        self.started = time.perf_counter()
+        self.hit = [False] * len(self.deadlines)
+        self.stopped_after = [None] * len(self.deadlines)
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        now = time.perf_counter()
+        done = []
+        for row, deadline in enumerate(self.deadlines):
+            expired = deadline is not None and now >= deadline
+            # Rows that already produced EOS finished on their own and are only being padded
+            if expired and not self.hit[row] and not (input_ids[row, self.prompt_length:] == self.eos_token_id).any():
+                self.hit[row] = True
+                self.stopped_after[row] = now - self.started
+            done.append(expired)
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+    
+    def as_kwargs(self):
+        """generate() arguments adding this criterion"""
+        return {'stopping_criteria': StoppingCriteriaList([self])}
+
+
+def cut_at_sentence(text):
+    """The text up to its last complete sentence, or '' if it has none"""
+    end = 0
+    for match in _SENTENCE_END.finditer(text):
+        end = match.end()
+    return text[:end].strip()
@@ -1,69 +1,280 @@
 from transformers import (
-    AutoModelForCausalLM, 
-    AutoTokenizer, 
-    TrainingArguments, 
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    TrainingArguments,
     Trainer,
-    DataCollatorForLanguageModeling
+    TrainerCallback
 )
-from datasets import Dataset
+from transformers.trainer_utils import get_last_checkpoint
+from datasets import Dataset, IterableDataset
+import dataclasses
+import math
+import os
+import time
 import torch
 import json
+import re
+
+_JSON_WHITESPACE = re.compile(r'[\s,]*')
+
+def _iter_json_array(f, chunk_size=1 << 20):
+    """Yield the elements of the first JSON array in a file, reading it in chunks"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+        start = buffer.find('[')
+        if start >= 0:
+            break
+    position = start + 1
+    
+    while True:
+        position = _JSON_WHITESPACE.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The next element runs past the end of the buffer: read more and retry
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+def iter_conversations(data_path):
+    """Stream conversations from a .jsonl file (one per line) or a .json file.
+    
+    A .json file may be a list of conversations or {"conversations": [...]};
+    either way it is parsed incrementally rather than loaded whole.
+    """
+    with open(data_path, 'r') as f:
+        if data_path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(f)
+
+def format_conversation(conv, eos_token):
+    """Flatten one conversation into training text, each bot turn closed by eos_token"""
+    text = ""
+    for turn in conv['conversation']:
+        if turn['speaker'] == 'user':
+            text += f"User: {turn['text']}"
+        else:
+            text += f"Bot: {turn['text']}{eos_token}"
+    return text
+
+# The dataset builders below are module-level functions taking plain arguments: datasets hashes
+# the function it is given to fingerprint the result, and a bound method would drag the whole
+# fine-tuner (model included) through dill on every call
+
+def _iter_texts(data_path, eos_token):
+    for conv in iter_conversations(data_path):
+        yield {'text': format_conversation(conv, eos_token)}
+
+def _tokenize_batch(examples, tokenizer, block_size, truncate=True):
+    encoded = tokenizer(
+        examples['text'],
+        truncation=truncate,
+        max_length=block_size if truncate else None
+    )
+    encoded['length'] = [len(ids) for ids in encoded['input_ids']]
+    return encoded
+
+def _pack_batch(examples, eos_token_id, block_size):
+    ids = []
+    for input_ids in examples['input_ids']:
+        ids.extend(input_ids)
+        if not input_ids or input_ids[-1] != eos_token_id:
+            ids.append(eos_token_id)
+    # As in the standard group_texts recipe, each map batch drops its tokens past the last full
+    # block; only a batch holding less than one block in total is kept whole, as one short block
+    if len(ids) >= block_size:
+        ids = ids[:len(ids) // block_size * block_size]
+    blocks = [ids[i:i + block_size] for i in range(0, len(ids), block_size)]
+    return {
+        'input_ids': blocks,
+        'attention_mask': [[1] * len(block) for block in blocks],
+        'length': [len(block) for block in blocks]
+    }
+
+def _length_grouping_args():
+    """TrainingArguments for length-grouped batches (renamed in transformers 5)"""
+    if 'train_sampling_strategy' in {field.name for field in dataclasses.fields(TrainingArguments)}:
+        return {'train_sampling_strategy': 'group_by_length'}
+    return {'group_by_length': True}
+
+def _tokens_seen_args():
+    """TrainingArguments that make the trainer count input tokens (non-padding ones where supported)"""
+    field = {field.name: field for field in dataclasses.fields(TrainingArguments)}.get('include_num_input_tokens_seen')
+    if field is None:
+        return {}
+    return {'include_num_input_tokens_seen': 'non_padding' if 'non_padding' in field.metadata.get('help', '') else True}
+
+def cpu_supports_bf16():
+    """Whether this CPU runs bf16 kernels natively (emulated bf16 is slower than fp32)"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+def cpu_training_args(num_threads=None, dataloader_workers=None, bf16=None):
+    """TrainingArguments for CPU-only training, sizing torch threads and dataloader workers to the machine.
+    
+    Tokenization happens before training, so the workers only collate batches:
+    a couple are enough to keep them off the training threads, and every other
+    core goes to torch's intra-op thread pool.
+    """
+    cores = os.cpu_count() or 1
+    if dataloader_workers is None:
+        dataloader_workers = min(2, cores // 8)
+    torch.set_num_threads(num_threads or max(1, cores - dataloader_workers))
+    return {
+        'use_cpu': True,
+        'bf16': cpu_supports_bf16() if bf16 is None else bf16,
+        'dataloader_num_workers': dataloader_workers,
+        'dataloader_persistent_workers': dataloader_workers > 0,
+        'dataloader_pin_memory': False
+    }
+
+class ThroughputCallback(TrainerCallback):
+    """Logs training tokens/sec over each logging interval"""
+    
+    def on_train_begin(self, args, state, control, **kwargs):
+        self._last_time = time.perf_counter()
+        self._last_tokens = state.num_input_tokens_seen
+    
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        now = time.perf_counter()
+        tokens = state.num_input_tokens_seen
+        if now > self._last_time and tokens > self._last_tokens:
+            tokens_per_second = round((tokens - self._last_tokens) / (now - self._last_time), 1)
+            # Recorded in the trainer state too, so it is kept in trainer_state.json with checkpoints
+            if state.log_history:
+                state.log_history[-1]['tokens_per_second'] = tokens_per_second
+            print(f"step {state.global_step}: {tokens_per_second} tokens/sec")
+        self._last_time = now
+        self._last_tokens = tokens
+
+class CausalLMCollator:
+    """Pads each batch to its own longest sequence; padding is masked out of the loss.
+    
+    Unlike DataCollatorForLanguageModeling this masks by attention mask rather than
+    by token id, so EOS tokens (which double as padding for DialoGPT) are still learned.
+    """
+    
+    def __init__(self, tokenizer, pad_to_multiple_of=8):
+        self.pad_token_id = tokenizer.pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+    
+    def __call__(self, features):
+        length = max(len(feature['input_ids']) for feature in features)
+        if self.pad_to_multiple_of:
+            length = -(-length // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        
+        input_ids = torch.full((len(features), length), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(features), length), dtype=torch.long)
+        for row, feature in enumerate(features):
+            ids = feature['input_ids']
+            input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, :len(ids)] = 1
+        labels = input_ids.masked_fill(attention_mask == 0, -100)
+        return {'input_ids': input_ids, 'attention_mask': attention_mask, 'labels': labels}
 
 class MentalHealthFineTuner:
-    def __init__(self, base_model="microsoft/DialoGPT-medium"):
+    def __init__(self, base_model="microsoft/DialoGPT-medium", block_size=512):
         self.base_model = base_model
+        self.block_size = block_size
         self.tokenizer = AutoTokenizer.from_pretrained(base_model)
         self.model = AutoModelForCausalLM.from_pretrained(base_model)
         
         if self.tokenizer.pad_token is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
     
-    def prepare_dataset(self, data_path):
-        """Prepare dataset for fine-tuning"""
-        with open(data_path, 'r') as f:
-            conversations = json.load(f)
-        
-        formatted_conversations = []
-        for conv in conversations:
-            text = ""
-            for turn in conv['conversation']:
-                if turn['speaker'] == 'user':
-                    text += f"User: {turn['text']}"
-                else:
-                    text += f"Bot: {turn['text']}{self.tokenizer.eos_token}"
-            formatted_conversations.append({'text': text})
+    def format_conversation(self, conv):
+        """Flatten one conversation into training text"""
+        return format_conversation(conv, self.tokenizer.eos_token)
+    
+    def prepare_dataset(self, data_path, streaming=False):
+        """Prepare dataset for fine-tuning from a JSON or JSONL conversation file.
         
-        return Dataset.from_list(formatted_conversations)
+        Conversations are streamed from disk: the default Dataset is written to an
+        on-disk Arrow cache, streaming=True returns an IterableDataset instead.
+        """
+        gen_kwargs = {'data_path': data_path, 'eos_token': self.tokenizer.eos_token}
+        if streaming:
+            return IterableDataset.from_generator(_iter_texts, gen_kwargs=gen_kwargs)
+        return Dataset.from_generator(_iter_texts, gen_kwargs=gen_kwargs)
     
-    def tokenize_function(self, examples):
-        """Tokenize the dataset"""
-        return self.tokenizer(
-            examples['text'],
-            truncation=True,
-            padding=True,
-            max_length=512
-        )
+    def tokenize_function(self, examples, truncate=True):
+        """Tokenize the dataset (padding is left to the collator at batch time)"""
+        return _tokenize_batch(examples, self.tokenizer, self.block_size, truncate)
+    
+    def pack_function(self, examples):
+        """Concatenate tokenized conversations and cut them into full block_size blocks, dropping the rest"""
+        return _pack_batch(examples, self.tokenizer.eos_token_id, self.block_size)
+    
+    def tokenize_dataset(self, dataset, pack=False):
+        """Tokenize once, optionally packing conversations into full blocks"""
+        # Packed conversations are split across blocks instead of being truncated
+        tokenized = dataset.map(_tokenize_batch, batched=True, remove_columns=['text'], fn_kwargs={
+            'tokenizer': self.tokenizer, 'block_size': self.block_size, 'truncate': not pack
+        })
+        if pack:
+            tokenized = tokenized.map(_pack_batch, batched=True,
+                                      remove_columns=['input_ids', 'attention_mask', 'length'],
+                                      fn_kwargs={'eos_token_id': self.tokenizer.eos_token_id,
+                                                 'block_size': self.block_size})
+        return tokenized
     
-    def fine_tune(self, train_dataset, output_dir="./fine_tuned_model"):
-        """Fine-tune the model"""
-        tokenized_dataset = train_dataset.map(self.tokenize_function, batched=True)
+    def fine_tune(self, train_dataset, output_dir="./fine_tuned_model", pack=False, group_by_length=True,
+                  max_steps=-1, per_device_batch_size=2, effective_batch_size=None, cpu_profile=False,
+                  resume=True):
+        """Fine-tune the model.
         
-        data_collator = DataCollatorForLanguageModeling(
-            tokenizer=self.tokenizer,
-            mlm=False
-        )
+        pack=True trains on full block_size blocks of concatenated conversations;
+        otherwise batches are padded to their longest member and, with
+        group_by_length, built from conversations of similar length. Streaming
+        (iterable) datasets need max_steps.
+        
+        effective_batch_size is reached through gradient accumulation over
+        per_device_batch_size batches. cpu_profile applies cpu_training_args
+        (bf16 autocast where the CPU supports it, thread and dataloader-worker
+        sizing). With resume, training continues from the latest checkpoint in
+        output_dir.
+        """
+        tokenized_dataset = self.tokenize_dataset(train_dataset, pack=pack)
+        data_collator = CausalLMCollator(self.tokenizer)
+        
+        sampling_args = {}
+        if group_by_length and not pack and isinstance(tokenized_dataset, Dataset):
+            sampling_args = _length_grouping_args()
+        profile_args = cpu_training_args() if cpu_profile else {}
+        accumulation_steps = math.ceil(effective_batch_size / per_device_batch_size) if effective_batch_size else 1
         
         training_args = TrainingArguments(
             output_dir=output_dir,
-            overwrite_output_dir=True,
             num_train_epochs=3,
-            per_device_train_batch_size=2,
+            max_steps=max_steps,
+            per_device_train_batch_size=per_device_batch_size,
+            gradient_accumulation_steps=accumulation_steps,
             save_steps=500,
             save_total_limit=2,
             prediction_loss_only=True,
             learning_rate=5e-5,
             warmup_steps=100,
             logging_steps=100,
+            length_column_name='length',
+            **sampling_args,
+            **profile_args,
+            **_tokens_seen_args()
         )
         
         trainer = Trainer(
@@ -71,8 +282,12 @@ class MentalHealthFineTuner:
             args=training_args,
             data_collator=data_collator,
             train_dataset=tokenized_dataset,
+            callbacks=[ThroughputCallback()],
         )
         
-        trainer.train()
+        checkpoint = get_last_checkpoint(output_dir) if resume and os.path.isdir(output_dir) else None
+        if checkpoint is not None:
+            print(f"Resuming training from {checkpoint}")
+        trainer.train(resume_from_checkpoint=checkpoint)
         trainer.save_model()
-        self.tokenizer.save_pretrained(output_dir)
\ No newline at end of file
+        self.tokenizer.save_pretrained(output_dir)
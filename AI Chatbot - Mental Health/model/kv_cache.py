@@ -0,0 +1,109 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class KVCacheEntry:
+    """Attention key/values for the history part of a session's prompt.
+
+    turns holds the text of each exchange covered, oldest first, and token_ids their
+    prompt tokens, exactly as a fresh prompt would encode them.
+    """
+    __slots__ = ('turns', 'token_ids', 'past_key_values', 'nbytes')
+    
+    def __init__(self, turns, token_ids, past_key_values):
+        self.turns = tuple(turns)
+        self.token_ids = token_ids
+        self.past_key_values = past_key_values
+        self.nbytes = token_ids.numel() * token_ids.element_size() + _past_nbytes(past_key_values)
+
+
+def _past_nbytes(past_key_values):
+    """Approximate memory held by a past_key_values object (legacy tuples or a Cache)"""
+    if past_key_values is None:
+        return 0
+    if hasattr(past_key_values, 'layers'):
+        layers = [(layer.keys, layer.values) for layer in past_key_values.layers]
+    elif hasattr(past_key_values, 'to_legacy_cache'):
+        layers = past_key_values.to_legacy_cache()
+    else:
+        layers = past_key_values
+    total = 0
+    for layer in layers:
+        for tensor in layer:
+            if tensor is not None:
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class SessionKVCache:
+    """LRU cache of per-session KV state held under a global memory budget"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.recomputes = 0
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+    
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Take a session's entry out of the cache (the caller puts it back when done).
+
+        A found entry only counts as a hit once the caller reports reusing it with record_hit().
+        """
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.current_bytes -= entry.nbytes
+            return entry
+
+    def record_hit(self):
+        """Count a prompt that reused a cached entry"""
+        with self._lock:
+            self.hits += 1
+
+    def put(self, session_id, entry):
+        """Store a session's entry, evicting least recently used sessions to fit the budget"""
+        if entry.nbytes > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(session_id, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+            while self._entries and self.current_bytes + entry.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+            self._entries[session_id] = entry
+            self.current_bytes += entry.nbytes
+        return True
+
+    def discard(self, session_id):
+        """Drop a session's entry if present"""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self.current_bytes -= entry.nbytes
+
+    def stats(self):
+        """Get cache occupancy and hit/miss counters"""
+        with self._lock:
+            return {
+                'sessions': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'recomputes': self.recomputes
+            }
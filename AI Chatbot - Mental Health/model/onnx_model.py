@@ -0,0 +1,223 @@
+"""Export a causal LM to ONNX with key/value cache inputs and run it with ONNX Runtime.
+
+Export a model (writes model.onnx plus its config and tokenizer) from the project root:
+    python -m model.onnx_model --model-name microsoft/DialoGPT-medium --output models/dialogpt-medium-onnx
+then serve it with MODEL_BACKEND=onnx MODEL_NAME=models/dialogpt-medium-onnx.
+"""
+import argparse
+import importlib.util
+import os
+
+import numpy as np
+import torch
+from torch import nn
+
+ONNX_FILE = 'model.onnx'
+
+
+def require(module):
+    """Raise ImportError with an install hint when an optional ONNX dependency is missing"""
+    if importlib.util.find_spec(module) is None:
+        raise ImportError(f"{module} is not installed; install the ONNX backend's dependencies with "
+                          f"pip install -r requirements-onnx.txt")
+
+
+class _CachedDecoder(nn.Module):
+    """One decoding step with the key/value cache flattened into plain tensor inputs and outputs"""
+    
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.num_layers = model.config.num_hidden_layers
+    
+    def forward(self, input_ids, attention_mask, position_ids, *past):
+        from transformers import DynamicCache
+        
+        cache = DynamicCache()
+        for layer in range(self.num_layers):
+            cache.update(past[2 * layer], past[2 * layer + 1], layer)
+        
+        # A 4D additive mask built here keeps padding and causality in the exported graph
+        # rather than whichever mask shortcut transformers picks for the example inputs
+        query_length, key_length = input_ids.shape[1], attention_mask.shape[1]
+        query_positions = torch.arange(query_length) + (key_length - query_length)
+        allowed = torch.arange(key_length)[None, :] <= query_positions[:, None]
+        allowed = allowed[None, None] & attention_mask[:, None, None, :].bool()
+        mask = torch.zeros(allowed.shape).masked_fill(~allowed, torch.finfo(torch.float32).min)
+        
+        output = self.model(input_ids=input_ids, attention_mask=mask, position_ids=position_ids,
+                            past_key_values=cache, use_cache=True, return_dict=True)
+        present = []
+        for layer in output.past_key_values.layers:
+            present.extend([layer.keys, layer.values])
+        return (output.logits, *present)
+
+
+def _cache_names(prefix, num_layers):
+    return [f'{prefix}.{layer}.{kind}' for layer in range(num_layers) for kind in ('key', 'value')]
+
+
+def export_model(model_name, output_dir, opset=17):
+    """Export model_name's decoder (with key/value cache inputs) to output_dir/model.onnx"""
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    
+    require('onnx')
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    model.eval()
+    config = model.config
+    num_layers = config.num_hidden_layers
+    heads = config.num_attention_heads
+    head_dim = config.hidden_size // heads
+    
+    # Example step: two new tokens after three cached ones, so both lengths are traced as dynamic
+    past = [torch.zeros(1, heads, 3, head_dim) for _ in range(2 * num_layers)]
+    example = (torch.tensor([[1, 2]]), torch.ones(1, 5, dtype=torch.long), torch.tensor([[3, 4]]), *past)
+    
+    past_names = _cache_names('past', num_layers)
+    present_names = _cache_names('present', num_layers)
+    dynamic_axes = {
+        'input_ids': {0: 'batch', 1: 'sequence'},
+        'attention_mask': {0: 'batch', 1: 'total_sequence'},
+        'position_ids': {0: 'batch', 1: 'sequence'},
+        'logits': {0: 'batch', 1: 'sequence'},
+    }
+    dynamic_axes.update({name: {0: 'batch', 2: 'past_sequence'} for name in past_names})
+    dynamic_axes.update({name: {0: 'batch', 2: 'total_sequence'} for name in present_names})
+    
+    os.makedirs(output_dir, exist_ok=True)
+    # The wrapper must be in eval mode itself: export restores its mode on the wrapped model afterwards
+    decoder = _CachedDecoder(model).eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            decoder, example, os.path.join(output_dir, ONNX_FILE),
+            input_names=['input_ids', 'attention_mask', 'position_ids'] + past_names,
+            output_names=['logits'] + present_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            dynamo=False
+        )
+    config.save_pretrained(output_dir)
+    model.generation_config.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+    return os.path.join(output_dir, ONNX_FILE)
+
+
+class OnnxCausalLM:
+    """An exported decoder run by ONNX Runtime, with the subset of generate() the chatbot uses.
+    
+    Sampling applies temperature, top-k and top-p in the same order as transformers and
+    draws with torch.multinomial, so a fixed torch seed gives the same samples as the
+    PyTorch model whenever both produce the same logits.
+    """
+    
+    def __init__(self, model_dir, threads=None):
+        import onnxruntime
+        from transformers import AutoConfig, GenerationConfig
+        
+        path = os.path.join(model_dir, ONNX_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; export it with python -m model.onnx_model")
+        
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.config = AutoConfig.from_pretrained(model_dir)
+        try:
+            self.generation_config = GenerationConfig.from_pretrained(model_dir)
+        except OSError:
+            self.generation_config = GenerationConfig.from_model_config(self.config)
+        
+        self.num_layers = self.config.num_hidden_layers
+        self.past_names = _cache_names('past', self.num_layers)
+        self.past_shape = (self.config.num_attention_heads, self.config.hidden_size // self.config.num_attention_heads)
+    
+    def _select(self, logits, do_sample, temperature, top_k, top_p):
+        """Next token per row: argmax, or a sample from the warped distribution"""
+        if not do_sample:
+            return torch.argmax(logits, dim=-1)
+        if temperature is not None and temperature != 1.0:
+            logits = logits / temperature
+        if top_k:
+            kth = torch.topk(logits, min(top_k, logits.shape[-1]))[0][..., -1, None]
+            logits = logits.masked_fill(logits < kth, -float('inf'))
+        if top_p is not None and top_p < 1.0:
+            sorted_logits, sorted_indices = torch.sort(logits, descending=False)
+            cumulative = sorted_logits.softmax(dim=-1).cumsum(dim=-1)
+            sorted_remove = cumulative <= (1 - top_p)
+            sorted_remove[..., -1:] = False
+            remove = sorted_remove.scatter(1, sorted_indices, sorted_remove)
+            logits = logits.masked_fill(remove, -float('inf'))
+        probs = torch.softmax(logits, dim=-1)
+        return torch.multinomial(probs, num_samples=1).squeeze(1)
+    
+    def generate(self, input_ids, attention_mask=None, max_new_tokens=None, max_length=None, do_sample=None,
+                 temperature=None, top_k=None, top_p=None, pad_token_id=None, eos_token_id=None,
+                 num_return_sequences=1, streamer=None, stopping_criteria=None, **kwargs):
+        """Decode with the key/value cache and return the prompt plus generated ids, like generate()"""
+        unsupported = sorted(name for name, value in kwargs.items() if value is not None and value is not False)
+        if unsupported or num_return_sequences != 1:
+            raise ValueError(f"OnnxCausalLM.generate does not support: {unsupported or ['num_return_sequences']}")
+        
+        defaults = self.generation_config
+        do_sample = defaults.do_sample if do_sample is None else do_sample
+        temperature = temperature if temperature is not None else defaults.temperature
+        top_k = top_k if top_k is not None else (defaults.top_k if defaults.top_k is not None else 50)
+        top_p = top_p if top_p is not None else defaults.top_p
+        eos_token_id = eos_token_id if eos_token_id is not None else self.config.eos_token_id
+        pad_token_id = pad_token_id if pad_token_id is not None else eos_token_id
+        if max_new_tokens is None:
+            max_new_tokens = (max_length or defaults.max_length or 20) - input_ids.shape[1]
+        
+        if attention_mask is None:
+            attention_mask = torch.ones(input_ids.shape, dtype=torch.long)
+        sequences = input_ids
+        finished = torch.zeros(input_ids.shape[0], dtype=torch.bool)
+        mask = attention_mask.numpy().astype(np.int64)
+        # Left padding shifts positions the same way generate() does
+        positions = np.clip(mask.cumsum(-1) - 1, 0, None)
+        empty = np.zeros((input_ids.shape[0], self.past_shape[0], 0, self.past_shape[1]), dtype=np.float32)
+        feed = {'input_ids': input_ids.numpy().astype(np.int64), 'attention_mask': mask, 'position_ids': positions}
+        feed.update({name: empty for name in self.past_names})
+        
+        if streamer is not None:
+            streamer.put(input_ids)
+        for _ in range(max(0, max_new_tokens)):
+            outputs = self.session.run(None, feed)
+            logits = torch.from_numpy(outputs[0][:, -1, :]).float()
+            next_tokens = self._select(logits, do_sample, temperature, top_k, top_p)
+            next_tokens = next_tokens.masked_fill(finished, pad_token_id)
+            sequences = torch.cat([sequences, next_tokens[:, None]], dim=1)
+            if streamer is not None:
+                streamer.put(next_tokens)
+            finished |= next_tokens == eos_token_id
+            if stopping_criteria is not None:
+                finished |= stopping_criteria(sequences, None)
+            if finished.all():
+                break
+            
+            mask = np.concatenate([mask, np.ones((mask.shape[0], 1), dtype=np.int64)], axis=1)
+            feed = {
+                'input_ids': next_tokens[:, None].numpy().astype(np.int64),
+                'attention_mask': mask,
+                'position_ids': feed['position_ids'][:, -1:] + 1,
+            }
+            feed.update(zip(self.past_names, outputs[1:]))
+        if streamer is not None:
+            streamer.end()
+        return sequences
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a causal LM to ONNX for MODEL_BACKEND=onnx')
+    parser.add_argument('--model-name', default=os.environ.get('MODEL_NAME', 'microsoft/DialoGPT-medium'))
+    parser.add_argument('--output', required=True, help='directory for model.onnx, its config and tokenizer')
+    parser.add_argument('--opset', type=int, default=17)
+    args = parser.parse_args()
+    
+    path = export_model(args.model_name, args.output, args.opset)
+    print(f"Exported {args.model_name} to {path}")
+
+
+if __name__ == '__main__':
+    main()
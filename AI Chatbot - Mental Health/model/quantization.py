@@ -0,0 +1,38 @@
+import torch
+from torch import nn
+
+QUANTIZE_MODES = ('int8',)
+
+def _conv1d_to_linear(conv):
+    """Convert a GPT-2 style Conv1D (weight stored as in x out) into an equivalent nn.Linear"""
+    in_features, out_features = conv.weight.shape
+    linear = nn.Linear(in_features, out_features)
+    linear.weight.data = conv.weight.data.t().contiguous()
+    linear.bias.data = conv.bias.data.clone()
+    return linear
+
+def replace_conv1d_with_linear(model):
+    """Swap every transformers Conv1D for nn.Linear so dynamic quantization can reach them.
+    
+    DialoGPT uses the GPT-2 architecture, whose attention and MLP projections are
+    Conv1D modules rather than nn.Linear; quantize_dynamic would otherwise only
+    quantize the LM head.
+    """
+    from transformers.pytorch_utils import Conv1D
+    
+    for name, module in list(model.named_children()):
+        if isinstance(module, Conv1D):
+            setattr(model, name, _conv1d_to_linear(module))
+        else:
+            replace_conv1d_with_linear(module)
+    return model
+
+def quantize_model(model, mode):
+    """Return a CPU model with weights quantized according to mode (None leaves it untouched)"""
+    if not mode:
+        return model
+    if mode not in QUANTIZE_MODES:
+        raise ValueError(f"Unsupported quantization mode: {mode} (expected one of {QUANTIZE_MODES})")
+    
+    model = replace_conv1d_with_linear(model.to('cpu').eval())
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
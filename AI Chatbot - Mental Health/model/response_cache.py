@@ -0,0 +1,96 @@
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_NON_WORD = re.compile(r"[^a-z0-9' ]+")
+_SPACES = re.compile(r"\s+")
+
+def normalize_message(text):
+    """Cache key for a message: lowercase, punctuation dropped, whitespace collapsed"""
+    return _SPACES.sub(' ', _NON_WORD.sub(' ', text.lower())).strip()
+
+class _CacheEntry:
+    __slots__ = ('candidates', 'created_at')
+    
+    def __init__(self, created_at):
+        self.candidates = []
+        self.created_at = created_at
+
+class ResponseCandidateCache:
+    """Pools of raw model replies for context-free messages, keyed by normalized text.
+    
+    A key is only served from the cache once its pool holds pool_size sampled
+    candidates; until then every request is a miss whose fresh generation is
+    added to the pool, so cached replies still vary between users. Entries
+    expire after ttl seconds and the least recently used keys are evicted
+    beyond max_entries.
+    """
+    
+    def __init__(self, max_entries=1000, ttl=3600, pool_size=4):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.pool_size = pool_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+    
+    def _after_fork(self):
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Return a random cached candidate, or None if the key's pool isn't full yet"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and now - entry.created_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None or len(entry.candidates) < self.pool_size:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return random.choice(entry.candidates)
+    
+    def add(self, key, candidate):
+        """Add a freshly generated candidate to the key's pool"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _CacheEntry(time.monotonic())
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._entries.move_to_end(key)
+            if len(entry.candidates) < self.pool_size:
+                entry.candidates.append(candidate)
+    
+    def stats(self):
+        """Hit-rate and occupancy counters"""
+        with self._lock:
+            entries = len(self._entries)
+            full = sum(1 for entry in self._entries.values() if len(entry.candidates) >= self.pool_size)
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'full_pools': full,
+            'max_entries': self.max_entries,
+            'pool_size': self.pool_size,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+import time
+
+
+class RetrievalResponder:
+    """Answers messages close to a curated user turn with that turn's curated reply.
+    
+    User turns from the curated conversations are indexed once with TF-IDF over word
+    unigrams and bigrams. A message whose cosine similarity to its nearest turn reaches
+    threshold gets the paired bot reply and skips generation; anything else returns
+    None so the caller falls back to the model. Latency saved is estimated from the
+    mean generation time observed for the messages that missed.
+    """
+    
+    def __init__(self, data_path='data/mental_health_conversations.json', threshold=0.6):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        
+        self.threshold = threshold
+        self.prompts, self.replies = self._load_pairs(data_path)
+        self.vectorizer = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True)
+        # Rows are L2-normalized, so a sparse dot product gives cosine similarities
+        self.matrix = self.vectorizer.fit_transform(self.prompts) if self.prompts else None
+        
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.hits = 0
+        self.lookup_seconds = 0.0
+        self.generations = 0
+        self.generation_seconds = 0.0
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+    
+    def _after_fork(self):
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _load_pairs(data_path):
+        """(user turns, the bot turns answering them) from a conversations file"""
+        with open(data_path, 'r') as f:
+            conversations = json.load(f)['conversations']
+        prompts, replies = [], []
+        for conversation in conversations:
+            turns = conversation['conversation']
+            for turn, answer in zip(turns, turns[1:]):
+                if turn['speaker'] == 'user' and answer['speaker'] == 'bot':
+                    prompts.append(turn['text'])
+                    replies.append(answer['text'])
+        return prompts, replies
+    
+    def __len__(self):
+        return len(self.prompts)
+    
+    def nearest(self, message):
+        """(index, similarity) of the curated user turn closest to message"""
+        if self.matrix is None:
+            return None, 0.0
+        similarities = (self.matrix @ self.vectorizer.transform([message]).T).toarray().ravel()
+        index = int(similarities.argmax())
+        return index, float(similarities[index])
+    
+    def respond(self, message):
+        """The curated reply for message, or None when no curated turn is similar enough"""
+        started = time.perf_counter()
+        index, similarity = self.nearest(message)
+        hit = index is not None and similarity >= self.threshold
+        with self._lock:
+            self.queries += 1
+            self.hits += hit
+            self.lookup_seconds += time.perf_counter() - started
+        return self.replies[index] if hit else None
+    
+    def observe_generation(self, seconds):
+        """Record how long a message that missed took to generate, for the latency-saved estimate"""
+        with self._lock:
+            self.generations += 1
+            self.generation_seconds += seconds
+    
+    def stats(self):
+        """Hit rate and the estimated generation time avoided"""
+        with self._lock:
+            mean_lookup = self.lookup_seconds / self.queries if self.queries else 0.0
+            mean_generation = self.generation_seconds / self.generations if self.generations else 0.0
+            return {
+                'pairs': len(self.prompts),
+                'threshold': self.threshold,
+                'queries': self.queries,
+                'hits': self.hits,
+                'hit_rate': round(self.hits / self.queries, 4) if self.queries else 0.0,
+                'mean_lookup_ms': round(mean_lookup * 1000, 3),
+                'mean_generation_ms': round(mean_generation * 1000, 1),
+                'seconds_saved': round(self.hits * max(0.0, mean_generation - mean_lookup), 3),
+            }
@@ -0,0 +1,53 @@
+import importlib
+import sys
+
+import pytest
+
+from model.retrieval import RetrievalResponder
+
+# A user turn from the middle of a curated conversation, whose curated reply assumes earlier turns
+LATER_TURN = "It's mostly work stress and some relationship issues"
+
+
+def load_api(tmp_path, monkeypatch, **env):
+    """api.api imported fresh under env, with a model that never loads so replies need no weights"""
+    monkeypatch.setenv('HF_HUB_OFFLINE', '1')
+    monkeypatch.setenv('MODEL_NAME', str(tmp_path / 'no-model'))
+    monkeypatch.setenv('MODEL_WARMUP', '0')
+    monkeypatch.setenv('METRICS_ENABLED', '0')
+    monkeypatch.setenv('LOG_FILE', str(tmp_path / 'user_sessions.log'))
+    monkeypatch.delenv('RETRIEVAL_ENABLED', raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.delitem(sys.modules, 'api.api', raising=False)
+    return importlib.import_module('api.api')
+
+
+@pytest.fixture
+def curated_replies():
+    return set(RetrievalResponder().replies)
+
+
+def test_first_turn_is_not_answered_with_a_curated_reply_by_default(tmp_path, monkeypatch, curated_replies):
+    api = load_api(tmp_path, monkeypatch)
+    assert api.retrieval is None
+    
+    reply = api.app.test_client().post('/api/chat', json={'message': LATER_TURN})
+    assert reply.status_code == 200
+    assert reply.get_json()['response'] not in curated_replies
+
+
+def test_curated_reply_goes_through_enhance_response(tmp_path, monkeypatch, curated_replies):
+    api = load_api(tmp_path, monkeypatch, RETRIEVAL_ENABLED='1')
+    enhanced = []
+    
+    def enhance(response, user_input):
+        enhanced.append((response, user_input))
+        return f"{response} [enhanced]"
+    
+    monkeypatch.setattr(api.chatbot, '_enhance', enhance)
+    reply = api.app.test_client().post('/api/chat', json={'message': LATER_TURN})
+    assert reply.status_code == 200
+    response, user_input = enhanced[0]
+    assert response in curated_replies and user_input == LATER_TURN
+    assert reply.get_json()['response'] == f"{response} [enhanced]"
@@ -0,0 +1,91 @@
+import gc
+import json
+import multiprocessing
+import queue
+import threading
+import weakref
+
+from utils.session_logger import SessionLogger
+
+
+def append_entries(log_file, count, started):
+    logger = SessionLogger(log_file=log_file)
+    started.set()
+    for i in range(count):
+        logger.log_interaction(f"writer-{i % 50}", 'user', f"message {i}")
+
+
+def test_rotation_keeps_entries_appended_by_another_process(tmp_path):
+    log_file = str(tmp_path / 'logs' / 'user_sessions.log')
+    logger = SessionLogger(log_file=log_file)
+    logger.log_interaction('rotator', 'user', 'first')
+    
+    count = 3000
+    context = multiprocessing.get_context('spawn')
+    started = context.Event()
+    writer = context.Process(target=append_entries, args=(log_file, count, started))
+    writer.start()
+    started.wait(60)
+    rotations = 0
+    while writer.is_alive():
+        logger.log_interaction('rotator', 'user', 'again')
+        rotations += logger.rotate() is not None
+    writer.join()
+    assert writer.exitcode == 0
+    assert rotations > 1
+    
+    written = [entry for entry in logger.iter_entries() if entry['session_id'].startswith('writer-')]
+    assert sorted(int(entry['message'].split()[1]) for entry in written) == list(range(count))
+    # Every rotated and active entry is indexed at offsets that still hold it
+    assert logger.get_session_count() == 51
+    assert len(logger.get_session_data('writer-7')) == count // 50
+    assert all(entry['session_id'] == 'writer-7' for entry in logger.get_session_data('writer-7'))
+
+
+def test_rotation_indexes_entries_appended_after_the_final_catch_up(tmp_path):
+    log_file = str(tmp_path / 'user_sessions.log')
+    logger = SessionLogger(log_file=log_file)
+    logger.log_interaction('a', 'user', 'indexed before rotation')
+    logger.index.catch_up()
+    
+    rotate_segment = logger.index.rotate_segment
+    
+    def append_then_rotate(segment, move):
+        # A writer that doesn't hold the log's lock (e.g. where fcntl is unavailable) appends in between
+        def late_move():
+            with open(log_file, 'a') as f:
+                entry = {'timestamp': '', 'session_id': 'b', 'speaker': 'user', 'message': 'appended late'}
+                f.write(json.dumps(entry) + '\n')
+            return move()
+        return rotate_segment(segment, late_move)
+    
+    logger.index.rotate_segment = append_then_rotate
+    assert logger.rotate() is not None
+    assert logger.get_session_count() == 2
+    assert [entry['message'] for entry in logger.get_session_data('b')] == ['appended late']
+
+
+def test_dropped_entries_are_counted_across_request_threads(tmp_path):
+    logger = SessionLogger(log_file=str(tmp_path / 'user_sessions.log'))
+    # A queue that is always full, so every entry is dropped
+    logger._queue = queue.Queue(maxsize=1)
+    logger._queue.put_nowait('')
+    
+    def log_many():
+        for i in range(2000):
+            logger.log_interaction('s', 'user', f"message {i}")
+    
+    threads = [threading.Thread(target=log_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert logger.stats()['dropped_entries'] == 16000
+
+
+def test_loggers_are_not_kept_alive_by_the_fork_hook(tmp_path):
+    logger = SessionLogger(log_file=str(tmp_path / 'user_sessions.log'))
+    ref = weakref.ref(logger)
+    del logger
+    gc.collect()
+    assert ref() is None
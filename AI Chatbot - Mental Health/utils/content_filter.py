@@ -2,11 +2,14 @@ import re
 import nltk
 from nltk.corpus import stopwords
 import json
+import threading
+from utils.phrase_matcher import PhraseMatcher
+from utils.profiling import stage_timer
 
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
+NON_LETTERS = re.compile(r"[^a-zA-Z ]")
+
+OFFENSIVE = 'offensive'
+MENTAL_HEALTH = 'mental_health'
 
 class ContentFilter:
     def __init__(self):
@@ -22,6 +25,12 @@ class ContentFilter:
             "scared", "afraid", "hopeless", "tired", "exhausted"
         }
         
+        # Multi-word phrases matched on the full token sequence (stopwords included).
+        # Empty by default, so messages are classified by the word sets above alone
+        self.offensive_phrases = set()
+        
+        self.mental_health_phrases = set()
+        
         self.empathetic_responses = [
             "I'm really sorry you're feeling this way. You're not alone—there are people who care about you.",
             "It sounds like you're going through a difficult time. I'm here to listen and support you.",
@@ -31,18 +40,67 @@ class ContentFilter:
             "Remember that difficult times don't last forever. You've gotten through hard times before.",
             "It's important that you're reaching out. That shows real strength, even when you don't feel strong."
         ]
+        
+        try:
+            self.stopwords = frozenset(stopwords.words('english'))
+        except LookupError:
+            # Don't block startup on a download; fetch the corpus in the background and recompile
+            self.stopwords = frozenset()
+            threading.Thread(target=self._download_stopwords, name='nltk-download', daemon=True).start()
+        self.compile()
+    
+    def _download_stopwords(self):
+        try:
+            if nltk.download('stopwords', quiet=True):
+                self.stopwords = frozenset(stopwords.words('english'))
+                self.compile()
+        except Exception as e:
+            print(f"Error downloading stopwords: {e}")
+    
+    def compile(self):
+        """Build the phrase matcher; call again after changing the word or phrase sets"""
+        matcher = PhraseMatcher()
+        # Single offensive words only count when they are not stopwords
+        for word in self.offensive_words - self.stopwords:
+            matcher.add(word, OFFENSIVE)
+        for phrase in self.offensive_phrases:
+            matcher.add(phrase, OFFENSIVE)
+        for word in self.mental_health_keywords | self.mental_health_phrases:
+            matcher.add(word, MENTAL_HEALTH)
+        self.matcher = matcher.compile()
+    
+    def _tokenize(self, text):
+        return NON_LETTERS.sub("", text.lower()).split()
+    
+    def analyze(self, text):
+        """Run both checks on a single tokenization of text"""
+        with stage_timer.stage('content_filter'):
+            labels = self.matcher.labels(self._tokenize(text))
+        return {
+            'offensive': OFFENSIVE in labels,
+            'mental_health': MENTAL_HEALTH in labels
+        }
+    
+    def classify_batch(self, texts):
+        """Analyze a list of messages in one call"""
+        labels_for = self.matcher.labels
+        tokenize = self._tokenize
+        results = []
+        for text in texts:
+            labels = labels_for(tokenize(text))
+            results.append({
+                'offensive': OFFENSIVE in labels,
+                'mental_health': MENTAL_HEALTH in labels
+            })
+        return results
     
     def is_offensive(self, text):
         """Check if text contains offensive or concerning content"""
-        cleaned = re.sub(r"[^a-zA-Z ]", "", text.lower())
-        tokens = set(cleaned.split()) - set(stopwords.words('english'))
-        return bool(tokens & self.offensive_words)
+        return self.analyze(text)['offensive']
     
     def contains_mental_health_keywords(self, text):
         """Check if text contains mental health related keywords"""
-        cleaned = re.sub(r"[^a-zA-Z ]", "", text.lower())
-        tokens = set(cleaned.split())
-        return bool(tokens & self.mental_health_keywords)
+        return self.analyze(text)['mental_health']
     
     def get_empathetic_response(self, step=0):
         """Get an empathetic response based on conversation step"""
@@ -0,0 +1,220 @@
+import bisect
+import math
+import os
+import threading
+from abc import ABC, abstractmethod
+
+# Prometheus text exposition format served by /metrics
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+    
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+class _Metric(ABC):
+    kind = None
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets else None
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+    
+    def labels(self, *values):
+        """The child metric for one combination of label values"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+    
+    def _reset_locks(self):
+        self._lock = threading.Lock()
+        for child in self._children.values():
+            child._lock = threading.Lock()
+    
+    @abstractmethod
+    def _new_child(self):
+        """A fresh child for one combination of label values"""
+    
+    @abstractmethod
+    def samples(self):
+        """(suffix, label names, label values, value) for every exposed sample"""
+
+class Counter(_Metric):
+    kind = 'counter'
+    
+    def _new_child(self):
+        return _CounterChild()
+    
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+    
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield '', self.labelnames, values, child.value
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames, buckets)
+    
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+    
+    def observe(self, value):
+        self._children[()].observe(value)
+    
+    def samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total, count = child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield '_bucket', self.labelnames + ('le',), values + (_format_value(bound),), cumulative
+            yield '_sum', self.labelnames, values, total
+            yield '_count', self.labelnames, values, count
+
+class CallbackMetric:
+    """A gauge or counter whose value is read from the component that owns it at scrape time"""
+    
+    def __init__(self, name, documentation, kind, read):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.read = read
+    
+    def _reset_locks(self):
+        pass
+    
+    def samples(self):
+        yield '', (), (), self.read()
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+    
+    def _after_fork(self):
+        for metric in self._metrics:
+            metric._reset_locks()
+    
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+    
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+    
+    def callback(self, name, documentation, read, kind='gauge'):
+        return self.register(CallbackMetric(name, documentation, kind, read))
+    
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                print(f"Error collecting metric {metric.name}: {e}")
+                continue
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for suffix, names, values, value in samples:
+                lines.append(f'{metric.name}{suffix}{_format_labels(names, values)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'chatbot_stage_seconds', 'Time spent in each stage of the chat pipeline', ['stage']
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'chatbot_request_seconds', 'End-to-end request latency', ['endpoint']
+)
+PROMPT_TOKENS = REGISTRY.counter('chatbot_prompt_tokens_total', 'Prompt tokens fed to the model')
+GENERATED_TOKENS = REGISTRY.counter('chatbot_generated_tokens_total', 'Tokens generated by the model')
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    'chatbot_generation_tokens_per_second', 'Generated tokens per second of model.generate time',
+    buckets=TOKENS_PER_SECOND_BUCKETS
+)
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    'chatbot_queue_wait_seconds', 'Time chat requests waited for the inference thread'
+)
+INFERENCE_SECONDS = REGISTRY.histogram(
+    'chatbot_inference_seconds', 'Generation time of the batch or cached-session call serving each chat request'
+)
+DEADLINES_EXCEEDED = REGISTRY.counter(
+    'chatbot_deadline_exceeded_total',
+    'Chat requests that ran out of latency budget, by outcome (expired_in_queue, partial, fallback)', ['outcome']
+)
+DEADLINE_WASTED_SECONDS = REGISTRY.counter(
+    'chatbot_deadline_wasted_seconds_total', 'Generation time spent on text discarded when a deadline cut a reply short'
+)
+ERRORS = REGISTRY.counter('chatbot_errors_total', 'Errors caught while serving requests', ['component'])
+
+def observe_stage(name, seconds):
+    """StageTimer observer feeding the per-stage latency histogram"""
+    STAGE_SECONDS.labels(name).observe(seconds)
+
+def record_generation(prompt_tokens, generated_tokens, seconds):
+    """Token counts and throughput of one model.generate call"""
+    PROMPT_TOKENS.inc(prompt_tokens)
+    GENERATED_TOKENS.inc(generated_tokens)
+    if generated_tokens and seconds > 0:
+        TOKENS_PER_SECOND.observe(generated_tokens / seconds)
+
+def record_deadline(outcome, wasted_seconds=0.0):
+    """One request that hit its deadline, and the generation time thrown away because of it"""
+    DEADLINES_EXCEEDED.labels(outcome).inc()
+    if wasted_seconds:
+        DEADLINE_WASTED_SECONDS.inc(wasted_seconds)
@@ -0,0 +1,66 @@
+from collections import deque
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over word tokens.
+    
+    Phrases are sequences of tokens, each tagged with a label. Matching a token
+    list walks the automaton once, so any number of single- and multi-word
+    phrases are found in a single pass over the text.
+    """
+    
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+        self._compiled = True
+    
+    def add(self, phrase, label):
+        """Add a phrase (string or token sequence) that reports label when matched"""
+        tokens = phrase.split() if isinstance(phrase, str) else list(phrase)
+        if not tokens:
+            return
+        state = 0
+        for token in tokens:
+            next_state = self._goto[state].get(token)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][token] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            state = next_state
+        self._output[state].add(label)
+        self._compiled = False
+    
+    def compile(self):
+        """Build failure links; called automatically before the first match"""
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(token, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+        self._compiled = True
+        return self
+    
+    def labels(self, tokens):
+        """Return the set of labels of every phrase occurring in tokens"""
+        if not self._compiled:
+            self.compile()
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for token in tokens:
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            if output[state]:
+                found |= output[state]
+        return found
@@ -0,0 +1,64 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+class StageTimer:
+    """Accumulated wall time per request-pipeline stage (content filter, tokenize, generate, ...).
+    
+    Disabled by default; when disabled a stage costs a single flag check. Batched
+    stages (tokenize, generate) are recorded once per batch, per-reply stages once
+    per reply.
+    """
+    
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._totals = {}
+        # Callables receiving (stage, seconds) for every recorded stage, e.g. metrics histograms
+        self.observers = []
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+    
+    def _after_fork(self):
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as one occurrence of stage name"""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+    
+    def record(self, name, seconds):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+            self._totals[name] = self._totals.get(name, 0.0) + seconds
+        for observer in self.observers:
+            observer(name, seconds)
+    
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self._totals.clear()
+    
+    def snapshot(self):
+        """Per-stage call count, total and mean milliseconds"""
+        with self._lock:
+            return {
+                name: {
+                    'count': count,
+                    'total_ms': round(self._totals[name] * 1000, 3),
+                    'mean_ms': round(self._totals[name] * 1000 / count, 3)
+                }
+                for name, count in self._counts.items()
+            }
+
+# Shared by the chatbot, the content filter and the API; enabled with PROFILE_STAGES=1
+stage_timer = StageTimer()
@@ -1,64 +1,160 @@
+import json
+import os
 import random
 import re
+import threading
+import time
+
+# Used when the data file is missing or a key is absent from it
+DEFAULT_TEMPLATES = {
+    'supportive_phrases': [
+        "I understand that must be difficult.",
+        "Thank you for sharing that with me.",
+        "It sounds like you're going through a lot.",
+        "Your feelings are completely valid.",
+        "I'm here to listen and support you."
+    ],
+    'follow_up_questions': [
+        "How long have you been feeling this way?",
+        "What do you think might have triggered these feelings?",
+        "Have you talked to anyone else about this?",
+        "What usually helps you feel better?",
+        "Would you like to explore this feeling more?"
+    ],
+    'coping_suggestions': [
+        "Have you tried taking some deep breaths or doing a brief meditation?",
+        "Sometimes going for a short walk can help clear your mind.",
+        "Writing down your thoughts might help organize your feelings.",
+        "Reaching out to a trusted friend or family member could provide support.",
+        "Consider speaking with a mental health professional if these feelings persist."
+    ],
+    'empathy_triggers': [
+        "sad", "depressed", "anxious", "worried", "scared",
+        "lonely", "hopeless", "tired", "overwhelmed", "stressed"
+    ],
+    'default_responses': [
+        "I'm here to listen. How are you feeling right now?",
+        "Thank you for reaching out. What's on your mind today?",
+        "I want to support you. Can you tell me more about what you're experiencing?",
+        "It's okay to take your time. I'm here when you're ready to share."
+    ]
+}
+
+class _Templates:
+    """One immutable load of the data file: phrase tuples plus the compiled trigger pattern"""
+    __slots__ = ('supportive_phrases', 'questions', 'coping_suggestions', 'defaults', 'trigger_pattern')
+    
+    def __init__(self, data):
+        merged = dict(DEFAULT_TEMPLATES, **{key: value for key, value in data.items() if value})
+        self.supportive_phrases = tuple(merged['supportive_phrases'])
+        self.questions = tuple(merged['follow_up_questions'])
+        self.coping_suggestions = tuple(merged['coping_suggestions'])
+        self.defaults = tuple(merged['default_responses'])
+        # One alternation matching any trigger as a substring, longest first
+        triggers = sorted({trigger.lower() for trigger in merged['empathy_triggers']}, key=len, reverse=True)
+        self.trigger_pattern = re.compile('|'.join(map(re.escape, triggers)))
 
 class ResponseGenerator:
-    def __init__(self):
-        self.supportive_phrases = [
-            "I understand that must be difficult.",
-            "Thank you for sharing that with me.",
-            "It sounds like you're going through a lot.",
-            "Your feelings are completely valid.",
-            "I'm here to listen and support you."
-        ]
-        
-        self.questions = [
-            "How long have you been feeling this way?",
-            "What do you think might have triggered these feelings?",
-            "Have you talked to anyone else about this?",
-            "What usually helps you feel better?",
-            "Would you like to explore this feeling more?"
-        ]
-        
-        self.coping_suggestions = [
-            "Have you tried taking some deep breaths or doing a brief meditation?",
-            "Sometimes going for a short walk can help clear your mind.",
-            "Writing down your thoughts might help organize your feelings.",
-            "Reaching out to a trusted friend or family member could provide support.",
-            "Consider speaking with a mental health professional if these feelings persist."
-        ]
+    """Wraps generated replies with supportive phrases and follow-up questions from a data file.
+    
+    The file is read once into an immutable snapshot. Every reload_interval seconds a
+    call checks the file's mtime; a change is loaded on a background thread and swapped
+    in with a single assignment, so requests never wait for a reload and always see
+    one complete version. A file that fails to load leaves the current snapshot in place.
+    """
+    
+    def __init__(self, data_path=None, reload_interval=2.0):
+        self.data_path = data_path or os.environ.get('RESPONSES_DATA', 'data/empathetic_responses.json')
+        self.reload_interval = reload_interval
+        self._reload_lock = threading.Lock()
+        self._next_check = time.monotonic() + reload_interval
+        # mtime of the last version read, loaded or not, so a broken file is only reported once
+        self._seen_mtime = self._mtime()
+        self.reloads = 0
+        self._templates = self._load(self._seen_mtime)
+        if self._templates is None:
+            print(f"Could not load {self.data_path}; using the built-in responses")
+            self._templates = _Templates({})
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+    
+    def _after_fork(self):
+        self._reload_lock = threading.Lock()
+    
+    def _mtime(self):
+        try:
+            return os.stat(self.data_path).st_mtime_ns
+        except OSError:
+            return None
+    
+    def _load(self, mtime):
+        """Read the data file into a new snapshot, or None if it can't be read"""
+        if mtime is None:
+            return None
+        try:
+            with open(self.data_path, 'r') as f:
+                return _Templates(json.load(f))
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"Error loading {self.data_path}: {e}")
+            return None
+    
+    def _reload(self, mtime):
+        try:
+            templates = self._load(mtime)
+            if templates is not None:
+                self._templates = templates
+                self.reloads += 1
+        finally:
+            self._reload_lock.release()
+    
+    def _current(self):
+        """The current snapshot, starting a background reload when the file has changed"""
+        now = time.monotonic()
+        if self.reload_interval and now >= self._next_check and self._reload_lock.acquire(blocking=False):
+            self._next_check = now + self.reload_interval
+            mtime = self._mtime()
+            if mtime is not None and mtime != self._seen_mtime:
+                self._seen_mtime = mtime
+                threading.Thread(target=self._reload, args=(mtime,), name='responses-reload', daemon=True).start()
+            else:
+                self._reload_lock.release()
+        return self._templates
+    
+    @property
+    def supportive_phrases(self):
+        return self._templates.supportive_phrases
+    
+    @property
+    def questions(self):
+        return self._templates.questions
+    
+    @property
+    def coping_suggestions(self):
+        return self._templates.coping_suggestions
     
     def enhance_response(self, generated_response, user_input):
         """Enhance the generated response for mental health context"""
+        templates = self._current()
         if not generated_response or len(generated_response.strip()) < 5:
-            return self.get_default_response()
+            return random.choice(templates.defaults)
         
         # Check if response needs empathy boost
-        if self._needs_empathy(user_input):
-            supportive_phrase = random.choice(self.supportive_phrases)
+        if self._needs_empathy(user_input, templates):
+            supportive_phrase = random.choice(templates.supportive_phrases)
             generated_response = f"{supportive_phrase} {generated_response}"
         
         # Add follow-up question occasionally
         if random.random() < 0.3:
-            question = random.choice(self.questions)
+            question = random.choice(templates.questions)
             generated_response += f" {question}"
         
         return generated_response
     
-    def _needs_empathy(self, user_input):
+    def _needs_empathy(self, user_input, templates=None):
         """Check if user input indicates need for extra empathy"""
-        empathy_triggers = [
-            "sad", "depressed", "anxious", "worried", "scared",
-            "lonely", "hopeless", "tired", "overwhelmed", "stressed"
-        ]
-        
-        return any(trigger in user_input.lower() for trigger in empathy_triggers)
+        templates = templates or self._templates
+        return templates.trigger_pattern.search(user_input.lower()) is not None
     
     def get_default_response(self):
         """Get a default supportive response"""
-        defaults = [
-            "I'm here to listen. How are you feeling right now?",
-            "Thank you for reaching out. What's on your mind today?",
-            "I want to support you. Can you tell me more about what you're experiencing?",
-            "It's okay to take your time. I'm here when you're ready to share."
-        ]
-        return random.choice(defaults)
\ No newline at end of file
+        return random.choice(self._current().defaults)
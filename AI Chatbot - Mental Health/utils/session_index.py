@@ -0,0 +1,199 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA_VERSION = 2
+
+class SessionIndex:
+    """SQLite sidecar index over a JSON-lines session log.
+    
+    Stores the segment, byte offset and length of every entry per session plus a
+    running count of unique sessions, and remembers how far into the active log
+    it has indexed so it only ever reads entries appended since the last catch-up.
+    Entries in the active log have an empty segment name.
+    """
+    
+    def __init__(self, log_file, index_file=None):
+        self.log_file = log_file
+        self.index_file = index_file or f"{log_file}.idx"
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._create_schema()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+    
+    def _connect(self):
+        # Several worker processes may share the index; wait for each other's write transactions
+        conn = sqlite3.connect(self.index_file, check_same_thread=False, isolation_level=None, timeout=60)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def _after_fork(self):
+        """SQLite connections must not be used across fork: open a fresh one in the child"""
+        # Keep the parent's connection referenced so it is never closed from the child
+        self._inherited_conn = self._conn
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+    
+    def _create_schema(self):
+        with self._lock:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            if self._get_meta('schema_version', SCHEMA_VERSION) != SCHEMA_VERSION:
+                # Older layout: drop it and let the logger re-index the log and its segments
+                self._conn.executescript('''
+                    DROP TABLE IF EXISTS entries;
+                    DROP TABLE IF EXISTS sessions;
+                    DELETE FROM meta;
+                ''')
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY);
+                CREATE TABLE IF NOT EXISTS entries (
+                    session_id TEXT NOT NULL,
+                    segment TEXT NOT NULL DEFAULT '',
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS entries_by_session ON entries (session_id);
+            ''')
+            self._set_meta('schema_version', SCHEMA_VERSION)
+    
+    def _get_meta(self, key, default=None):
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+    
+    def _set_meta(self, key, value):
+        self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+    
+    def _reset(self):
+        self._conn.execute('DELETE FROM entries')
+        self._conn.execute('DELETE FROM sessions')
+        self._set_meta('offset', 0)
+        self._set_meta('session_count', 0)
+    
+    def catch_up(self):
+        """Index every complete line appended to the log since the last call"""
+        if not os.path.exists(self.log_file):
+            return 0
+        
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so several processes sharing
+            # one log never index the same range twice
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                indexed = self._catch_up_locked()
+                self._conn.execute('COMMIT')
+                return indexed
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+    
+    def _catch_up_locked(self):
+        """catch_up body; the caller holds the write transaction"""
+        if not os.path.exists(self.log_file):
+            return 0
+        offset = self._get_meta('offset', 0)
+        if os.path.getsize(self.log_file) < offset:
+            # The log was truncated or replaced outside rotate_segment; start over
+            self._reset()
+            offset = 0
+        
+        with open(self.log_file, 'rb') as f:
+            f.seek(offset)
+            indexed, new_sessions, offset = self._index_lines(f, '', offset)
+        
+        self._set_meta('offset', offset)
+        if new_sessions:
+            self._set_meta('session_count', self._get_meta('session_count', 0) + new_sessions)
+        return indexed
+    
+    def _index_lines(self, f, segment, offset):
+        """Index complete lines from f starting at offset; returns (indexed, new_sessions, offset)"""
+        indexed = 0
+        new_sessions = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break  # Partially written entry; pick it up next time
+            try:
+                session_id = json.loads(line)['session_id']
+            except (ValueError, KeyError, TypeError):
+                offset += len(line)
+                continue
+            self._conn.execute(
+                'INSERT INTO entries (session_id, segment, offset, length) VALUES (?, ?, ?, ?)',
+                (session_id, segment, offset, len(line))
+            )
+            new_sessions += self._conn.execute(
+                'INSERT OR IGNORE INTO sessions (session_id) VALUES (?)', (session_id,)
+            ).rowcount
+            offset += len(line)
+            indexed += 1
+        return indexed, new_sessions, offset
+    
+    def session_count(self):
+        """Number of unique sessions indexed so far"""
+        with self._lock:
+            return self._get_meta('session_count', 0)
+    
+    def session_entries(self, session_id):
+        """(segment, offset, length) of every entry for a session, in log order"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT segment, offset, length FROM entries WHERE session_id = ? ORDER BY rowid',
+                (session_id,)
+            ).fetchall()
+    
+    def rotate_segment(self, segment, move):
+        """Rotate the active log into segment and repoint its entries.
+        
+        move() performs the actual file rotation and returns the size in bytes of the
+        log it moved, or False to skip it. It runs inside the index's write transaction,
+        after a final catch-up, so no process can index the log while it is being moved.
+        Anything appended between that catch-up and the move is indexed from the
+        segment, so the index always covers exactly what was compressed.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._catch_up_locked()
+                moved = move()
+                if moved is False:
+                    self._conn.execute('ROLLBACK')
+                    return False
+                self._conn.execute("UPDATE entries SET segment = ? WHERE segment = ''", (segment,))
+                offset = self._get_meta('offset', 0)
+                if moved > offset:
+                    with gzip.open(os.path.join(os.path.dirname(self.log_file), segment), 'rb') as f:
+                        f.seek(offset)
+                        _, new_sessions, _ = self._index_lines(f, segment, offset)
+                    if new_sessions:
+                        self._set_meta('session_count', self._get_meta('session_count', 0) + new_sessions)
+                self._set_meta('offset', 0)
+                self._conn.execute('COMMIT')
+                return True
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+    
+    def index_segment(self, segment, path):
+        """Index an already rotated (gzip compressed) segment, e.g. when rebuilding"""
+        with self._lock:
+            if self._conn.execute('SELECT 1 FROM entries WHERE segment = ? LIMIT 1', (segment,)).fetchone():
+                return 0
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                with gzip.open(path, 'rb') as f:
+                    indexed, new_sessions, _ = self._index_lines(f, segment, 0)
+                if new_sessions:
+                    self._set_meta('session_count', self._get_meta('session_count', 0) + new_sessions)
+                self._conn.execute('COMMIT')
+                return indexed
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
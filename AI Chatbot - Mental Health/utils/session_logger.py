@@ -1,12 +1,101 @@
+import glob
+import gzip
 import json
 import os
+import shutil
+import sqlite3
+import atexit
+import queue
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from datetime import datetime
 import pandas as pd
+from utils.session_index import SessionIndex
+from utils.metrics import ERRORS
+from utils.profiling import stage_timer
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+EXPORT_COLUMNS = ['timestamp', 'session_id', 'speaker', 'message']
+
+# Every live logger, so one at-fork hook can restart their writers without keeping them alive
+_instances = weakref.WeakSet()
+
+def _after_fork_in_child():
+    for logger in list(_instances):
+        logger._after_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock shared by every process using the same log (no-op where fcntl is unavailable)"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
 
 class SessionLogger:
-    def __init__(self, log_file="logs/user_sessions.log"):
+    def __init__(self, log_file="logs/user_sessions.log", buffered=False, flush_interval=1.0,
+                 flush_size=100, max_queue_size=10000, fsync=False, indexed=True,
+                 max_bytes=0, rotate_interval=0):
         self.log_file = log_file
+        self._lock_file = f"{log_file}.lock"
         self.ensure_log_directory()
+        
+        # Rotation into gzip segments by size (bytes) and/or age (seconds); 0 disables either
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self._segment_started = self._read_segment_start()
+        self._write_lock = threading.Lock()
+        
+        # Sidecar index so session lookups and counts don't rescan the whole log
+        self.index = None
+        if indexed:
+            self.index = SessionIndex(log_file)
+            for segment in self.list_segments():
+                self.index.index_segment(os.path.basename(segment), segment)
+            self.index.catch_up()
+        
+        # Write-behind mode: entries are queued and written in batches by a background thread
+        self.buffered = buffered
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.fsync = fsync
+        # Request threads and the background writer both count drops
+        self._stats_lock = threading.Lock()
+        self.dropped_entries = 0
+        self.written_entries = 0
+        self.write_batches = 0
+        self._queue = None
+        self._writer = None
+        self._closed = threading.Event()
+        if buffered:
+            self._queue = queue.Queue(maxsize=max_queue_size)
+            self._writer = threading.Thread(target=self._write_loop, name='session-log-writer', daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+        _instances.add(self)
+    
+    def _after_fork(self):
+        """Pre-fork servers: the writer thread doesn't survive fork, so start a new one in the child"""
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        if self._queue is not None and not self._closed.is_set():
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._writer = threading.Thread(target=self._write_loop, name='session-log-writer', daemon=True)
+            self._writer.start()
     
     def ensure_log_directory(self):
         """Ensure the logs directory exists"""
@@ -20,51 +109,252 @@ class SessionLogger:
             'speaker': speaker,
             'message': message
         }
+        line = json.dumps(log_entry) + '\n'
+        
+        if self._queue is None or self._closed.is_set():
+            self._write_lines([line])
+            return
         
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(log_entry) + '\n')
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            # Never block the request thread on logging
+            self._count_dropped(1)
     
-    def get_session_data(self, session_id):
-        """Retrieve all interactions for a specific session"""
-        interactions = []
-        if os.path.exists(self.log_file):
+    def _count_dropped(self, count):
+        with self._stats_lock:
+            self.dropped_entries += count
+    
+    def _write_lines(self, lines):
+        """Append lines to the log file in a single write"""
+        with self._write_lock:
+            if self._should_rotate():
+                self._rotate()
+            # One append of the whole batch, so concurrent worker processes never interleave lines.
+            # The file is opened under the lock rotation takes, so no process can append to a log
+            # that has already been moved aside for compression
+            with _file_lock(self._lock_file), open(self.log_file, 'ab') as f:
+                f.write(''.join(lines).encode('utf-8'))
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            if self._segment_started is None:
+                self._segment_started = time.time()
+            self.written_entries += len(lines)
+            self.write_batches += 1
+    
+    def _read_segment_start(self):
+        """Time the active log was started, taken from its first entry"""
+        try:
             with open(self.log_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        entry = json.loads(line.strip())
-                        if entry['session_id'] == session_id:
-                            interactions.append(entry)
-                    except json.JSONDecodeError:
-                        continue
-        return interactions
+                return datetime.fromisoformat(json.loads(f.readline())['timestamp']).timestamp()
+        except (OSError, ValueError, KeyError):
+            return None
     
-    def get_session_count(self):
-        """Get total number of unique sessions"""
-        sessions = set()
+    def _should_rotate(self):
+        if self._segment_started is None:
+            return False
+        if self.max_bytes and os.path.exists(self.log_file) and os.path.getsize(self.log_file) >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.time() - self._segment_started >= self.rotate_interval
+    
+    def rotate(self):
+        """Move the active log into a gzip compressed segment and start a new one"""
+        with self._write_lock:
+            return self._rotate(force=True)
+    
+    def _rotate(self, force=False):
+        segment = f"{self.log_file}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.gz"
+        
+        def move():
+            # Another worker process may have rotated first; re-check against the file on disk
+            if not os.path.exists(self.log_file) or os.path.getsize(self.log_file) == 0:
+                return False
+            self._segment_started = self._read_segment_start()
+            if not force and not self._should_rotate():
+                return False
+            rotating = f"{segment}.rotating"
+            os.replace(self.log_file, rotating)
+            with open(rotating, 'rb') as src, gzip.open(segment, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            moved = os.path.getsize(rotating)
+            os.remove(rotating)
+            return moved
+        
+        # Appends take the same lock, so the moved log holds everything written before it was moved
+        with _file_lock(self._lock_file):
+            if self.index is not None:
+                # The index runs move() inside its write transaction, after a final catch-up
+                rotated = self.index.rotate_segment(os.path.basename(segment), move)
+            else:
+                rotated = move()
+        
+        if not rotated:
+            return None
+        self._segment_started = None
+        return segment
+    
+    def list_segments(self):
+        """Rotated segments, oldest first"""
+        return sorted(glob.glob(glob.escape(self.log_file) + '.*.gz'))
+    
+    def _open_segment(self, segment):
+        """Open a rotated segment (by file name) or the active log ('') for binary reading"""
+        if not segment:
+            return open(self.log_file, 'rb')
+        return gzip.open(os.path.join(os.path.dirname(self.log_file), segment), 'rb')
+    
+    def iter_entries(self):
+        """Stream every entry written so far across rotated segments and the active log, oldest first"""
+        paths = self.list_segments()
         if os.path.exists(self.log_file):
-            with open(self.log_file, 'r', encoding='utf-8') as f:
+            paths.append(self.log_file)
+        for path in paths:
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rt', encoding='utf-8') as f:
                 for line in f:
                     try:
-                        entry = json.loads(line.strip())
-                        sessions.add(entry['session_id'])
+                        yield json.loads(line.strip())
                     except json.JSONDecodeError:
                         continue
-        return len(sessions)
     
-    def export_to_csv(self, output_file="logs/sessions_export.csv"):
-        """Export session logs to CSV"""
+    def _write_loop(self):
+        """Background writer: drain the queue in batches of flush_size or every flush_interval"""
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    line = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if line is None:
+                    self._queue.task_done()
+                    self._flush_batch(batch)
+                    return
+                batch.append(line)
+            self._flush_batch(batch)
+    
+    def _flush_batch(self, batch):
+        if not batch:
+            return
+        try:
+            with stage_timer.stage('log_write'):
+                self._write_lines(batch)
+                if self.index is not None:
+                    self.index.catch_up()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error writing session log: {e}")
+            ERRORS.labels('session_logger').inc()
+            self._count_dropped(len(batch))
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+    
+    def flush(self):
+        """Block until every queued entry has been written"""
+        if self._queue is not None and self._writer.is_alive():
+            self._queue.join()
+    
+    def close(self):
+        """Flush pending entries and stop the background writer"""
+        if self._queue is None or self._closed.is_set():
+            return
+        self._closed.set()
+        self._queue.put(None)
+        self._writer.join()
+    
+    def stats(self):
+        """Get writer counters for monitoring"""
+        return {
+            'buffered': self.buffered,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'dropped_entries': self.dropped_entries,
+            'written_entries': self.written_entries,
+            'write_batches': self.write_batches
+        }
+    
+    def _catch_up_index(self):
+        """Index entries written since the last catch-up; the background writer does this after every batch"""
+        if self._writer is None or not self._writer.is_alive():
+            self.index.catch_up()
+    
+    def get_session_data(self, session_id):
+        """Retrieve all interactions for a specific session.
+        
+        Reads never wait for the write-behind queue, so entries logged within the
+        last flush interval may not be included yet.
+        """
+        if self.index is not None:
+            return self._read_indexed_entries(session_id)
+        
+        return [entry for entry in self.iter_entries() if entry.get('session_id') == session_id]
+    
+    def _read_indexed_entries(self, session_id):
+        """Read a session's entries by seeking straight to their indexed offsets"""
+        self._catch_up_index()
         interactions = []
-        if os.path.exists(self.log_file):
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        entry = json.loads(line.strip())
-                        interactions.append(entry)
-                    except json.JSONDecodeError:
-                        continue
+        handles = {}
+        try:
+            for segment, offset, length in self.index.session_entries(session_id):
+                if segment not in handles:
+                    handles[segment] = self._open_segment(segment)
+                f = handles[segment]
+                f.seek(offset)
+                try:
+                    interactions.append(json.loads(f.read(length)))
+                except json.JSONDecodeError:
+                    continue
+        finally:
+            for f in handles.values():
+                f.close()
+        return interactions
+    
+    def get_session_count(self):
+        """Get total number of unique sessions, as of the last write (see get_session_data)"""
+        if self.index is not None:
+            self._catch_up_index()
+            return self.index.session_count()
+        
+        return len({entry.get('session_id') for entry in self.iter_entries()})
+    
+    def export_to_csv(self, output_file="logs/sessions_export.csv", start=None, end=None,
+                      session_ids=None, chunk_size=10000):
+        """Export session logs to CSV, streaming in chunks so memory stays bounded.
+        
+        start/end (datetime or ISO string) limit the time range, and session_ids
+        limits the export to the given sessions.
+        """
+        start = start.isoformat() if isinstance(start, datetime) else start
+        end = end.isoformat() if isinstance(end, datetime) else end
+        session_ids = set(session_ids) if session_ids else None
+        
+        # An export is an explicit snapshot, so it does wait for queued entries
+        self.flush()
+        written = 0
+        chunk = []
+        with open(output_file, 'w', encoding='utf-8', newline='') as f:
+            for entry in self.iter_entries():
+                timestamp = entry.get('timestamp', '')
+                if start and timestamp < start:
+                    continue
+                if end and timestamp >= end:
+                    continue
+                if session_ids is not None and entry.get('session_id') not in session_ids:
+                    continue
+                chunk.append(entry)
+                if len(chunk) >= chunk_size:
+                    pd.DataFrame(chunk, columns=EXPORT_COLUMNS).to_csv(f, index=False, header=written == 0)
+                    written += len(chunk)
+                    chunk = []
+            if chunk:
+                pd.DataFrame(chunk, columns=EXPORT_COLUMNS).to_csv(f, index=False, header=written == 0)
+                written += len(chunk)
         
-        if interactions:
-            df = pd.DataFrame(interactions)
-            df.to_csv(output_file, index=False)
+        if written:
             return output_file
-        return None
\ No newline at end of file
+        os.remove(output_file)
+        return None
@@ -0,0 +1,272 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+class SessionRecord:
+    """Compact per-session state: only the exchanges the model can still see are kept"""
+    __slots__ = ('history', 'created_at', 'last_seen', 'step', 'turns', 'max_history')
+    
+    def __init__(self, max_history):
+        self.history = []
+        self.created_at = datetime.now()
+        self.last_seen = time.monotonic()
+        self.step = 0
+        self.turns = 0
+        self.max_history = max_history
+    
+    def add_exchange(self, user_input, response):
+        """Record an exchange, dropping the oldest beyond max_history"""
+        self.history.append({'user': user_input, 'bot': response})
+        if len(self.history) > self.max_history:
+            del self.history[:-self.max_history]
+        self.turns += 1
+
+class SessionStore:
+    """In-memory session store with idle expiry and a global LRU cap"""
+    
+    def __init__(self, max_sessions=10000, idle_ttl=1800, max_history=3, sweep_interval=60):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_history = max_history
+        self.sweep_interval = sweep_interval
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self._sweeper = None
+        self._stopped = threading.Event()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+    
+    def _after_fork(self):
+        """Pre-fork servers: recreate the lock and restart the sweeper in the child"""
+        self._lock = threading.Lock()
+        if self._sweeper is not None:
+            self._sweeper = None
+            self.start()
+    
+    def start(self):
+        """Start the background idle-expiry sweeper (idempotent)"""
+        if self.idle_ttl and (self._sweeper is None or not self._sweeper.is_alive()):
+            self._stopped.clear()
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='session-sweeper', daemon=True)
+            self._sweeper.start()
+        return self
+    
+    def stop(self):
+        self._stopped.set()
+    
+    def save(self, session_id, record):
+        """Persist changes to a record (records are live objects here, so nothing to do)"""
+    
+    def get_or_create(self, session_id):
+        """Return (session_id, record), creating a new session if the id is unknown or expired"""
+        now = time.monotonic()
+        with self._lock:
+            record = self._sessions.get(session_id) if session_id else None
+            if record is not None and self.idle_ttl and now - record.last_seen > self.idle_ttl:
+                del self._sessions[session_id]
+                self.expired += 1
+                record = None
+            
+            if record is None:
+                session_id = str(uuid.uuid4())
+                record = SessionRecord(self.max_history)
+                self._sessions[session_id] = record
+                self.created += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            
+            record.last_seen = now
+            return session_id, record
+    
+    def sweep(self):
+        """Drop every session idle for longer than idle_ttl; returns how many were removed"""
+        if not self.idle_ttl:
+            return 0
+        cutoff = time.monotonic() - self.idle_ttl
+        removed = 0
+        with self._lock:
+            # Sessions are kept in least-recently-used order, so stop at the first live one
+            while self._sessions:
+                session_id, record = next(iter(self._sessions.items()))
+                if record.last_seen > cutoff:
+                    break
+                del self._sessions[session_id]
+                removed += 1
+            self.expired += removed
+        return removed
+    
+    def _sweep_loop(self):
+        while not self._stopped.wait(self.sweep_interval):
+            self.sweep()
+    
+    def __len__(self):
+        return len(self._sessions)
+    
+    def stats(self):
+        """Occupancy and eviction counters for monitoring"""
+        with self._lock:
+            active = len(self._sessions)
+        return {
+            'backend': 'memory',
+            'active': active,
+            'max_sessions': self.max_sessions,
+            'occupancy': round(active / self.max_sessions, 4) if self.max_sessions else 0.0,
+            'idle_ttl_seconds': self.idle_ttl,
+            'max_history': self.max_history,
+            'created': self.created,
+            'expired': self.expired,
+            'evicted': self.evicted
+        }
+
+class SQLiteSessionStore(SessionStore):
+    """Session store shared by every worker process on the host through a SQLite file.
+    
+    Records are loaded on get_or_create and written back with save(), so any
+    worker can serve any session. Idle expiry and the LRU cap use wall-clock
+    last-seen times stored alongside each session.
+    """
+    
+    def __init__(self, db_path="logs/sessions.db", max_sessions=10000, idle_ttl=1800, max_history=3,
+                 sweep_interval=60):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        super().__init__(max_sessions=max_sessions, idle_ttl=idle_ttl, max_history=max_history,
+                         sweep_interval=sweep_interval)
+        self._conn = self._connect()
+        with self._lock:
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    history TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    last_seen REAL NOT NULL,
+                    step INTEGER NOT NULL,
+                    turns INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS sessions_by_last_seen ON sessions (last_seen);
+                CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            ''')
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def _after_fork(self):
+        # Keep the parent's connection referenced so it is never closed from the child
+        self._inherited_conn = self._conn
+        self._conn = self._connect()
+        super()._after_fork()
+    
+    def _bump(self, name, amount=1):
+        if amount:
+            self._conn.execute(
+                'INSERT INTO counters (name, value) VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+                (name, amount)
+            )
+    
+    def get_or_create(self, session_id):
+        """Return (session_id, record), creating a new session if the id is unknown or expired"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = None
+                if session_id:
+                    row = self._conn.execute(
+                        'SELECT history, created_at, last_seen, step, turns FROM sessions WHERE session_id = ?',
+                        (session_id,)
+                    ).fetchone()
+                if row is not None and self.idle_ttl and now - row[2] > self.idle_ttl:
+                    self._conn.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+                    self._bump('expired')
+                    row = None
+                
+                record = SessionRecord(self.max_history)
+                if row is None:
+                    session_id = str(uuid.uuid4())
+                    self._conn.execute(
+                        'INSERT INTO sessions (session_id, history, created_at, last_seen, step, turns) '
+                        'VALUES (?, ?, ?, ?, 0, 0)',
+                        (session_id, '[]', record.created_at.isoformat(), now)
+                    )
+                    self._bump('created')
+                    overflow = self._conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0] - self.max_sessions
+                    if overflow > 0:
+                        self._conn.execute(
+                            'DELETE FROM sessions WHERE session_id IN '
+                            '(SELECT session_id FROM sessions ORDER BY last_seen LIMIT ?)',
+                            (overflow,)
+                        )
+                        self._bump('evicted', overflow)
+                else:
+                    record.history = json.loads(row[0])
+                    record.created_at = datetime.fromisoformat(row[1])
+                    record.step = row[3]
+                    record.turns = row[4]
+                    self._conn.execute('UPDATE sessions SET last_seen = ? WHERE session_id = ?', (now, session_id))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        record.last_seen = now
+        return session_id, record
+    
+    def save(self, session_id, record):
+        """Write a record's history and counters back so other workers see them"""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE sessions SET history = ?, last_seen = ?, step = ?, turns = ? WHERE session_id = ?',
+                (json.dumps(record.history), time.time(), record.step, record.turns, session_id)
+            )
+    
+    def sweep(self):
+        """Drop every session idle for longer than idle_ttl; returns how many were removed"""
+        if not self.idle_ttl:
+            return 0
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                removed = self._conn.execute(
+                    'DELETE FROM sessions WHERE last_seen < ?', (time.time() - self.idle_ttl,)
+                ).rowcount
+                self._bump('expired', removed)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return removed
+    
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+    
+    def stats(self):
+        """Occupancy and eviction counters for monitoring (shared by all workers)"""
+        active = len(self)
+        with self._lock:
+            counters = dict(self._conn.execute('SELECT name, value FROM counters').fetchall())
+        return {
+            'backend': 'sqlite',
+            'active': active,
+            'max_sessions': self.max_sessions,
+            'occupancy': round(active / self.max_sessions, 4) if self.max_sessions else 0.0,
+            'idle_ttl_seconds': self.idle_ttl,
+            'max_history': self.max_history,
+            'created': counters.get('created', 0),
+            'expired': counters.get('expired', 0),
+            'evicted': counters.get('evicted', 0)
+        }